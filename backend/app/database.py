@@ -4,9 +4,12 @@ MongoDB Database Configuration (Simplified SSL Version for Render)
 import os
 import logging
 import certifi
+from concurrent.futures import ThreadPoolExecutor
 from pymongo import MongoClient
 from pymongo.errors import ServerSelectionTimeoutError
 
+from app.models import STUDENT_SEARCH_TERMS_EXPR
+
 
 class MongoDB:
     def __init__(self):
@@ -26,7 +29,7 @@ class MongoDB:
         # Initialize collections (safe to reference later)
         if self.db is not None:
             self._init_collections()
-            self._create_indexes()
+            self.create_indexes()
 
     # ---------------------------------------------------------------------
 
@@ -45,6 +48,17 @@ class MongoDB:
                 "serverSelectionTimeoutMS": server_timeout,
                 # prefer modern 'tls' option; avoid using deprecated 'ssl' parameter
                 "tls": True,
+                # One pool per gunicorn worker: enough sockets for its request
+                # threads plus the report query pool, so workers x pool stays
+                # well under the cluster's connection limit
+                "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 32)),
+                "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 5)),
+                # Fail fast instead of queueing indefinitely when the pool is exhausted
+                "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)),
+                "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 10000)),
+                "retryWrites": True,
+                # zstd needs the 'zstandard' package; pymongo skips it (falling back to zlib) otherwise
+                "compressors": "zstd,zlib",
             }
 
             if insecure:
@@ -92,32 +106,83 @@ class MongoDB:
 
     # ---------------------------------------------------------------------
 
-    def _create_indexes(self):
-        """Create database indexes for better performance"""
+    def create_indexes(self):
+        """Create database indexes for better performance
+
+        Each index is created on its own, so one failure does not skip the rest.
+        """
         if self.db is None:
             return
 
+        for collection, keys, options in self._index_specs():
+            try:
+                collection.create_index(keys, **options)
+            except Exception as e:
+                if "already exists" not in str(e):
+                    print(f"⚠️ Warning: Could not create index {keys} on {collection.name}: {e}")
+
+        self._migrate_student_search()
+        self._drop_retired_indexes()
+
+    def _index_specs(self):
+        """(collection, keys, create_index options) for every index the app relies on"""
+        return [
+            (self.users, "email", {"unique": True}),
+            (self.students, "student_id", {"unique": True}),
+            (self.students, "email", {"unique": True}),
+            (self.students, "class_id", {"background": True}),
+            (self.students, "parent_id", {"background": True}),
+            (self.students, [("last_name", 1), ("_id", 1)], {"background": True}),
+            (self.students, "search_terms", {"name": "student_search_terms_idx", "background": True}),
+            (self.classes, "teacher_id", {"background": True}),
+            (self.attendance, [("student_id", 1), ("date", 1)],
+             {"unique": False, "name": "student_date_idx", "background": True}),
+            (self.attendance, "class_id", {"background": True}),
+            (self.attendance, [("date", 1), ("status", 1)],
+             {"name": "date_status_idx", "background": True}),
+            # Report filters: date (range) plus optional class, grouped by status
+            (self.attendance, [("date", 1), ("class_id", 1), ("status", 1)],
+             {"name": "date_class_status_idx", "background": True}),
+        ]
+
+    def _migrate_student_search(self):
+        """Backfill student search terms on documents written before they existed"""
         try:
-            self.users.create_index("email", unique=True)
-            self.students.create_index("student_id", unique=True)
-            self.students.create_index("email", unique=True)
-            self._migrate_attendance_indexes()
+            self.students.update_many(
+                {"search_terms": {"$exists": False}},
+                [{"$set": {"search_terms": STUDENT_SEARCH_TERMS_EXPR}}],
+            )
         except Exception as e:
-            print(f"⚠️ Warning: Could not create indexes: {e}")
-
-    def _migrate_attendance_indexes(self):
-        """Create optimized attendance indexes"""
+            print(f"⚠️ Could not migrate student search: {e}")
+
+    def _drop_retired_indexes(self):
+        """Drop student indexes no query uses any more, so writes stop maintaining them"""
+        retired = (
+            "student_search_idx",  # superseded by search_terms prefix matching
+            "class_id_1__id_1",    # class_id alone serves every class filter
+        )
         try:
-            self.attendance.create_index(
-                [("student_id", 1), ("date", 1)],
-                unique=False,
-                name="student_date_idx",
-                background=True,
-            )
-            self.attendance.create_index("class_id", background=True)
+            existing = self.students.index_information()
+            for name in retired:
+                if name in existing:
+                    self.students.drop_index(name)
         except Exception as e:
-            if "already exists" not in str(e):
-                print(f"⚠️ Could not create attendance indexes: {e}")
+            print(f"⚠️ Could not drop retired indexes: {e}")
+
+    # ---------------------------------------------------------------------
+
+    def reset_collections(self, names):
+        """Drop the given collections (indexes included)
+
+        Dropping is a metadata operation, unlike delete_many which removes
+        documents one by one; the drops are issued concurrently. Call
+        create_indexes once the collections are repopulated.
+        """
+        if self.db is None:
+            return
+
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            list(executor.map(self.db.drop_collection, names))
 
     # ---------------------------------------------------------------------
 
@@ -133,7 +198,7 @@ class MongoDB:
 
             from app.utils.demo_data import initialize_demo_data
 
-            initialize_demo_data(self.db)
+            initialize_demo_data(self.db, rebuild_indexes=self.create_indexes)
             return True
         except Exception as e:
             print(f"❌ Error checking/seeding data: {e}")
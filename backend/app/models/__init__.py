@@ -6,7 +6,43 @@ Using PyMongo for MongoDB operations
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from werkzeug.security import generate_password_hash, check_password_hash
 import bcrypt
+import logging
+import os
+
+# argon2 is optional - fall back to werkzeug's pbkdf2 if not available
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import VerificationError, InvalidHashError
+    ARGON2_AVAILABLE = True
+except ImportError:
+    ARGON2_AVAILABLE = False
+    PasswordHasher = None
+
+logger = logging.getLogger(__name__)
+
+# Student fields matched by the listing search, lower-cased into `search_terms`
+# (a multikey index, so anchored prefix regexes are index range scans)
+STUDENT_SEARCH_FIELDS = ('first_name', 'last_name', 'student_id')
+STUDENT_SEARCH_TERMS_EXPR = [{'$toLower': f'${field}'} for field in STUDENT_SEARCH_FIELDS]
+
+
+def student_search_terms(student: Dict[str, Any]) -> List[str]:
+    """Lower-cased search terms of a student document"""
+    return [str(student.get(field) or '').lower() for field in STUDENT_SEARCH_FIELDS]
+
+
+# argon2id parameters (OWASP minimum: 19 MiB, 2 iterations, 1 lane)
+password_hasher = PasswordHasher(
+    time_cost=2, memory_cost=19456, parallelism=1
+) if ARGON2_AVAILABLE else None
+
+# pbkdf2 fallback - iteration count tunable for the latency/security tradeoff
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', '600000'))
+PBKDF2_METHOD = f'pbkdf2:sha256:{PBKDF2_ITERATIONS}'
+ARGON2_PREFIX = '$argon2'
 
 
 class BaseModel:
@@ -60,10 +96,9 @@ class User(BaseModel):
     
     def create(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new user"""
-        # Hash password using werkzeug (consistent with demo data)
+        # Hash password (argon2id, or pbkdf2 if argon2 is not installed)
         if 'password' in user_data:
-            from werkzeug.security import generate_password_hash
-            user_data['password'] = generate_password_hash(user_data['password'], method='pbkdf2:sha256')
+            user_data['password'] = self.hash_password(user_data['password'])
         
         # Add timestamps
         user_data['created_at'] = datetime.utcnow()
@@ -75,49 +110,86 @@ class User(BaseModel):
         
         return self.to_dict(user_data)
     
-    def find_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        """Find user by email"""
-        user = self.collection.find_one({'email': email})
+    def find_by_email(self, email: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Find user by email (optionally projecting only some fields)"""
+        user = self.collection.find_one({'email': email}, projection)
         return self.to_dict(user) if user else None
-    
-    def find_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Find user by ID"""
-        user = self.collection.find_one({'_id': self.to_object_id(user_id)})
+
+    def find_by_id(self, user_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Find user by ID (optionally projecting only some fields)"""
+        user = self.collection.find_one({'_id': self.to_object_id(user_id)}, projection)
         return self.to_dict(user) if user else None
     
-    def verify_password(self, email: str, password: str) -> bool:
-        """Verify user password"""
-        user = self.collection.find_one({'email': email})
-        if not user:
-            print(f"🔍 Password verification failed: User not found")
-            return False
+    @staticmethod
+    def hash_password(password: str) -> str:
+        """Hash a password with argon2id, or pbkdf2 if argon2 is not installed"""
+        if password_hasher:
+            return password_hasher.hash(password)
         
+        return generate_password_hash(password, method=PBKDF2_METHOD)
+    
+    @staticmethod
+    def _check_password_hash(stored_hash: str, password: str) -> bool:
+        """Check a password against an argon2 or werkzeug (pbkdf2) hash"""
+        if stored_hash.startswith(ARGON2_PREFIX):
+            if not password_hasher:
+                logger.error("argon2 hash found but argon2-cffi is not installed")
+                return False
+            try:
+                return password_hasher.verify(stored_hash, password)
+            except (VerificationError, InvalidHashError):
+                return False
+        
+        return check_password_hash(stored_hash, password)
+    
+    @staticmethod
+    def needs_rehash(stored_hash: str) -> bool:
+        """Whether a stored hash should be upgraded to the current argon2id parameters"""
+        if not password_hasher:
+            return False
+        if not stored_hash.startswith(ARGON2_PREFIX):
+            return True
+        return password_hasher.check_needs_rehash(stored_hash)
+    
+    def check_password(self, user: Dict[str, Any], password: str) -> bool:
+        """Check a password against an already loaded user document"""
         # Use only the 'password' field (consistent with demo data)
         stored_hash = user.get('password')
         if not stored_hash:
-            print(f"🔍 Password verification failed: No password field found")
+            logger.debug("Password verification failed: no password field for %s", user.get('email'))
             return False
         
-        print(f"🔍 Stored hash type: {type(stored_hash)}")
-        print(f"🔍 Stored hash length: {len(stored_hash) if stored_hash else 0}")
-        
         try:
-            # Use werkzeug's check_password_hash (consistent with demo data)
-            from werkzeug.security import check_password_hash
-            result = check_password_hash(stored_hash, password)
-            print(f"🔍 Werkzeug verification result: {result}")
-            return result
+            return self._check_password_hash(stored_hash, password)
         except Exception as e:
-            print(f"🔍 Password verification error: {e}")
+            logger.error("Password verification error: %s", e)
             return False
     
-    def update(self, user_id: str, update_data: Dict[str, Any]) -> bool:
-        """Update user"""
-        update_data['updated_at'] = datetime.utcnow()
+    def verify_password(self, email: str, password: str) -> bool:
+        """Verify user password, upgrading legacy pbkdf2 hashes on success"""
+        user = self.collection.find_one({'email': email}, {'email': 1, 'password': 1})
+        if not user or not self.check_password(user, password):
+            return False
+        
+        # Lazy migration: rehash with argon2id now that we have the plaintext
+        if self.needs_rehash(user['password']):
+            self.collection.update_one(
+                {'_id': user['_id']},
+                {'$set': {'password': self.hash_password(password)}}
+            )
+        
+        return True
+    
+    def update(self, user_id: str, update_data: Dict[str, Any],
+               touch: Optional[List[str]] = None) -> bool:
+        """Update user; updated_at and any `touch` fields get the server's current date"""
+        update = {'$currentDate': dict.fromkeys(['updated_at', *(touch or [])], True)}
+        if update_data:
+            update['$set'] = update_data
         
         result = self.collection.update_one(
             {'_id': self.to_object_id(user_id)},
-            {'$set': update_data}
+            update
         )
         return result.modified_count > 0
 
@@ -133,12 +205,39 @@ class Student(BaseModel):
         """Create a new student"""
         student_data['created_at'] = datetime.utcnow()
         student_data['updated_at'] = datetime.utcnow()
+        student_data['search_terms'] = student_search_terms(student_data)
         
         result = self.collection.insert_one(student_data)
         student_data['_id'] = result.inserted_id
         
         return self.to_dict(student_data)
     
+    def create_many(self, students: List[Dict[str, Any]]):
+        """
+        Create several students in one batched write
+        
+        Returns:
+            tuple: (created students, {batch index: server write error} for rejected documents)
+        """
+        if not students:
+            return [], {}
+        
+        now = datetime.utcnow()
+        for student_data in students:
+            student_data['created_at'] = now
+            student_data['updated_at'] = now
+            student_data['search_terms'] = student_search_terms(student_data)
+        
+        failed = {}
+        try:
+            # insert_many sets each document's _id in place
+            self.collection.insert_many(students, ordered=False)
+        except BulkWriteError as e:
+            failed = {error['index']: error for error in e.details.get('writeErrors', [])}
+        
+        created = [self.to_dict(s) for i, s in enumerate(students) if i not in failed]
+        return created, failed
+    
     def find_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Find all students with optional filters"""
         query = filters or {}
@@ -146,6 +245,33 @@ class Student(BaseModel):
         students = list(self.collection.find(query).sort('last_name', 1))
         return [self.to_dict(student) for student in students]
     
+    def find_page(self, filters: Dict[str, Any], skip: int, limit: int) -> List[Dict[str, Any]]:
+        """Find one page of students, ordered by last name"""
+        students = self.collection.find(filters or {}).sort(
+            [('last_name', 1), ('_id', 1)]
+        ).skip(skip).limit(limit)
+        return [self.to_dict(student) for student in students]
+    
+    def find_after(self, filters: Dict[str, Any], after_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Find the students that follow after_id in last-name order (keyset pagination)"""
+        anchor = self.collection.find_one({'_id': self.to_object_id(after_id)}, {'last_name': 1})
+        if not anchor:
+            return []
+        
+        last_name = anchor.get('last_name')
+        keyset = {'$or': [
+            {'last_name': {'$gt': last_name}},
+            {'last_name': last_name, '_id': {'$gt': anchor['_id']}}
+        ]}
+        query = {'$and': [filters, keyset]} if filters else keyset
+        
+        students = self.collection.find(query).sort([('last_name', 1), ('_id', 1)]).limit(limit)
+        return [self.to_dict(student) for student in students]
+    
+    def count(self, filters: Dict[str, Any] = None) -> int:
+        """Count students matching the filters"""
+        return self.collection.count_documents(filters or {})
+    
     def find_by_id(self, student_id: str) -> Optional[Dict[str, Any]]:
         """Find student by ID"""
         student = self.collection.find_one({
@@ -153,47 +279,80 @@ class Student(BaseModel):
         })
         return self.to_dict(student) if student else None
     
+    def find_by_ids(self, student_ids: List[str],
+                    projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Find several students by ID in one query (optionally projecting only some fields)"""
+        if not student_ids:
+            return []
+        
+        students = self.collection.find({
+            '_id': {'$in': [self.to_object_id(sid) for sid in student_ids]}
+        }, projection).sort('last_name', 1)
+        return [self.to_dict(student) for student in students]
+    
     def find_by_class(self, class_id: str) -> List[Dict[str, Any]]:
         """Find students by class"""
         try:
-            print(f"🔍 Finding students for class: {class_id}")
             # First, get the class to find the student IDs
             class_object_id = self.to_object_id(class_id)
             class_doc = self.db.classes.find_one({'_id': class_object_id})
             
-            print(f"   - Class document found: {class_doc is not None}")
-            if class_doc:
-                print(f"   - Class name: {class_doc.get('name', 'N/A')}")
-                print(f"   - Students in class: {class_doc.get('students', [])}")
-            
             if not class_doc or 'students' not in class_doc:
-                print("   - No class or no students field")
                 return []
             
             student_ids = class_doc.get('students', [])
             if not student_ids:
-                print("   - No student IDs in class")
                 return []
             
-            print(f"   - Looking for {len(student_ids)} students")
             # Find students by their IDs
             students = list(self.collection.find({
                 '_id': {'$in': student_ids}
             }).sort('last_name', 1))
             
-            print(f"   - Found {len(students)} students")
-            result = [self.to_dict(student) for student in students]
-            print(f"   - Returning {len(result)} students after to_dict")
-            return result
+            return [self.to_dict(student) for student in students]
         except Exception as e:
-            print(f"❌ Error in find_by_class: {e}")
+            logger.error("Error in find_by_class: %s", e)
             return []
-    
+
+    def count_by_classes(self, class_ids: List[str]) -> Dict[str, int]:
+        """Count existing students for several classes in one aggregation"""
+        if not class_ids:
+            return {}
+
+        pipeline = [
+            {'$match': {'_id': {'$in': [self.to_object_id(cid) for cid in class_ids]}}},
+            {
+                # Join only the ids of the students that still exist: the
+                # equality join uses the _id index and no document is loaded
+                '$lookup': {
+                    'from': 'students',
+                    'localField': 'students',
+                    'foreignField': '_id',
+                    'pipeline': [{'$project': {'_id': 1}}],
+                    'as': 'members'
+                }
+            },
+            {'$project': {'student_count': {'$size': '$members'}}}
+        ]
+
+        return {
+            str(doc['_id']): doc['student_count']
+            for doc in self.db.classes.aggregate(pipeline)
+        }
+
+    def count_by_class(self, class_id: str) -> int:
+        """Count the class's listed students that still exist (an _id index count)"""
+        class_doc = self.db.classes.find_one(
+            {'_id': self.to_object_id(class_id)}, {'students': 1}
+        )
+        student_ids = (class_doc or {}).get('students') or []
+        if not student_ids:
+            return 0
+        return self.collection.count_documents({'_id': {'$in': student_ids}})
+
     def find_by_parent(self, parent_id: str) -> List[Dict[str, Any]]:
         """Find students by parent ID"""
         try:
-            print(f"🔍 Finding students for parent: {parent_id}")
-            
             parent_object_id = self.to_object_id(parent_id)
             
             # Find students where parent_id matches
@@ -201,20 +360,27 @@ class Student(BaseModel):
                 'parent_id': parent_object_id
             }).sort('last_name', 1))
             
-            print(f"   - Found {len(students)} students for parent")
-            result = [self.to_dict(student) for student in students]
-            return result
+            return [self.to_dict(student) for student in students]
         except Exception as e:
-            print(f"❌ Error in find_by_parent: {e}")
+            logger.error("Error in find_by_parent: %s", e)
             return []
     
     def update(self, student_id: str, update_data: Dict[str, Any]) -> bool:
         """Update student"""
         update_data['updated_at'] = datetime.utcnow()
         
+        update = {'$set': update_data}
+        if any(field in update_data for field in STUDENT_SEARCH_FIELDS):
+            # Rebuild search_terms from the stored document in the same write;
+            # values are wrapped in $literal so strings are not read as field paths
+            update = [
+                {'$set': {key: {'$literal': value} for key, value in update_data.items()}},
+                {'$set': {'search_terms': STUDENT_SEARCH_TERMS_EXPR}}
+            ]
+        
         result = self.collection.update_one(
             {'_id': self.to_object_id(student_id)},
-            {'$set': update_data}
+            update
         )
         return result.modified_count > 0
     
@@ -255,6 +421,29 @@ class Class(BaseModel):
         })
         return self.to_dict(cls) if cls else None
     
+    def find_with_students(self, class_id: str) -> Optional[Dict[str, Any]]:
+        """Find class by ID with its student documents joined in one aggregation"""
+        pipeline = [
+            {'$match': {'_id': self.to_object_id(class_id)}},
+            {
+                '$lookup': {
+                    'from': 'students',
+                    'localField': 'students',
+                    'foreignField': '_id',
+                    'as': 'student_docs'
+                }
+            }
+        ]
+        cls = next(self.collection.aggregate(pipeline), None)
+        if not cls:
+            return None
+        
+        students = sorted(cls.pop('student_docs'), key=lambda s: s.get('last_name', ''))
+        result = self.to_dict(cls)
+        result['students'] = [self.to_dict(student) for student in students]
+        result['student_count'] = len(students)
+        return result
+    
     def find_by_teacher(self, teacher_id: str) -> List[Dict[str, Any]]:
         """Find classes by teacher"""
         # Convert teacher_id to ObjectId for the query
@@ -310,10 +499,11 @@ class Attendance(BaseModel):
     
     def find_by_date_and_class(self, date: str, class_id: str) -> List[Dict[str, Any]]:
         """Find attendance records by date and class"""
-        records = list(self.collection.find({
-            'date': date,
-            'class_id': class_id
-        }))
+        # Only ship the fields the class roster view reads
+        records = list(self.collection.find(
+            {'date': date, 'class_id': class_id},
+            projection={'student_id': 1, 'status': 1, 'notes': 1, 'marked_at': 1}
+        ))
         return [self.to_dict(record) for record in records]
     
     def find_student_history(self, student_id: str, limit: int = 30) -> List[Dict[str, Any]]:
@@ -323,6 +513,14 @@ class Attendance(BaseModel):
         }).sort('date', -1).limit(limit))
         return [self.to_dict(record) for record in records]
     
+    def find_student_range(self, student_id: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """Find a student's attendance between two YYYY-MM-DD dates (inclusive), oldest first"""
+        records = self.collection.find({
+            'student_id': student_id,
+            'date': {'$gte': start_date, '$lte': end_date}
+        }).sort('date', 1)
+        return [self.to_dict(record) for record in records]
+    
     def find(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Find attendance records with custom filters"""
         if filters is None:
@@ -331,30 +529,65 @@ class Attendance(BaseModel):
         return [self.to_dict(record) for record in records]
 
     def get_statistics(self, filters: Dict[str, Any] = None) -> Dict[str, Any]:
-        """Get attendance statistics"""
+        """Get attendance statistics (counts, percentages and rates in one round-trip)"""
         pipeline = []
-        
+
         if filters:
             pipeline.append({'$match': filters})
-        
+
+        def rate(status):
+            # Percentage of `status` over the total, rounded server-side
+            return {'$round': [{'$multiply': [
+                {'$divide': [{'$ifNull': [f'$$counts.{status}', 0]}, '$total']}, 100
+            ]}, 2]}
+
         pipeline.extend([
             {
                 '$group': {
-                    '_id': '$status',
+                    '_id': {'$ifNull': ['$status', 'unknown']},
                     'count': {'$sum': 1}
                 }
+            },
+            {
+                '$group': {
+                    '_id': None,
+                    'counts': {'$push': {'k': '$_id', 'v': '$count'}},
+                    'total': {'$sum': '$count'}
+                }
+            },
+            {
+                '$project': {
+                    '_id': 0,
+                    'total': 1,
+                    'counts': {'$arrayToObject': '$counts'},
+                    'percentages': {'$arrayToObject': {'$map': {
+                        'input': '$counts',
+                        'as': 'c',
+                        'in': {
+                            'k': {'$concat': ['$$c.k', '_percentage']},
+                            'v': {'$round': [{'$multiply': [{'$divide': ['$$c.v', '$total']}, 100]}, 2]}
+                        }
+                    }}},
+                    'rates': {'$let': {
+                        'vars': {'counts': {'$arrayToObject': '$counts'}},
+                        'in': {
+                            'attendance_rate': rate('present'),
+                            'absence_rate': rate('absent'),
+                            'tardiness_rate': rate('late')
+                        }
+                    }}
+                }
             }
         ])
-        
-        results = list(self.collection.aggregate(pipeline))
-        stats = {result['_id']: result['count'] for result in results}
-        
-        total = sum(stats.values())
-        if total > 0:
-            for status in stats:
-                stats[f'{status}_percentage'] = round((stats[status] / total) * 100, 2)
-        
-        stats['total'] = total
+
+        result = next(self.collection.aggregate(pipeline), None)
+        if not result:
+            return {'total': 0}
+
+        stats = result['counts']
+        stats.update(result['percentages'])
+        stats.update(result['rates'])
+        stats['total'] = result['total']
         return stats
 
 
@@ -4,10 +4,14 @@ Attendance Management Routes for Intelligent Attendance Register
 
 from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from pymongo import ReturnDocument
 from datetime import datetime, date, timedelta
+from functools import lru_cache
+import re
 
 from app.models import Attendance, Student, Class
 from app.utils.validation import validate_attendance_data, sanitize_input, validate_date_range
+from app.routes.reports import invalidate_report_cache
 from app.utils.api_response import (
     success_response, error_response, validation_error_response,
     not_found_response, forbidden_response, server_error_response
@@ -15,6 +19,23 @@ from app.utils.api_response import (
 
 attendance_bp = Blueprint('attendance', __name__)
 
+VALID_ATTENDANCE_STATUSES = frozenset(('present', 'absent', 'late', 'excused'))
+ALLOWED_MARK_ROLES = frozenset(('admin', 'teacher'))
+
+_ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+@lru_cache(maxsize=1024)
+def _valid_iso_date(date_str: str) -> bool:
+    """Check that a date string is a real YYYY-MM-DD date (cached per string)"""
+    if not _ISO_DATE_RE.match(date_str):
+        return False
+    try:
+        date.fromisoformat(date_str)
+    except ValueError:
+        return False
+    return True
+
 
 @attendance_bp.route('/mark', methods=['POST'])
 @jwt_required()
@@ -23,7 +44,7 @@ def mark_attendance():
     try:
         # Check permissions
         claims = get_jwt()
-        if claims.get('role') not in ['admin', 'teacher']:
+        if claims.get('role') not in ALLOWED_MARK_ROLES:
             return forbidden_response("Insufficient permissions to mark attendance")
         
         data = request.get_json()
@@ -55,6 +76,7 @@ def mark_attendance():
         # Mark attendance
         attendance_model = Attendance(current_app.db)
         attendance_record = attendance_model.mark_attendance(attendance_data)
+        invalidate_report_cache()
         
         return success_response(
             data=attendance_record,
@@ -74,7 +96,7 @@ def bulk_mark_attendance():
     try:
         # Check permissions
         claims = get_jwt()
-        if claims.get('role') not in ['admin', 'teacher']:
+        if claims.get('role') not in ALLOWED_MARK_ROLES:
             return forbidden_response("Insufficient permissions")
         
         data = request.get_json()
@@ -127,6 +149,9 @@ def bulk_mark_attendance():
                     'errors': [str(e)]
                 })
         
+        if marked_records:
+            invalidate_report_cache()
+        
         response_data = {
             'marked_records': marked_records,
             'errors': errors,
@@ -160,7 +185,7 @@ def mark_class_attendance():
     try:
         # Check permissions
         claims = get_jwt()
-        if claims.get('role') not in ['admin', 'teacher']:
+        if claims.get('role') not in ALLOWED_MARK_ROLES:
             return forbidden_response("Insufficient permissions to mark attendance")
         
         data = request.get_json()
@@ -230,6 +255,9 @@ def mark_class_attendance():
                     'error': str(e)
                 })
         
+        if marked_records:
+            invalidate_report_cache()
+        
         response_data = {
             'marked_records': marked_records,
             'errors': errors,
@@ -359,9 +387,7 @@ def get_class_attendance_by_date(class_id, date_str):
     """Get attendance for a specific class on a specific date"""
     try:
         # Validate date format
-        try:
-            datetime.strptime(date_str, '%Y-%m-%d')
-        except ValueError:
+        if not _valid_iso_date(date_str):
             return validation_error_response({"date": ["Invalid date format. Use YYYY-MM-DD"]})
         
         attendance_model = Attendance(current_app.db)
@@ -507,7 +533,7 @@ def update_attendance(attendance_id):
     try:
         # Check permissions
         claims = get_jwt()
-        if claims.get('role') not in ['admin', 'teacher']:
+        if claims.get('role') not in ALLOWED_MARK_ROLES:
             return forbidden_response("Insufficient permissions")
         
         data = request.get_json()
@@ -518,22 +544,14 @@ def update_attendance(attendance_id):
         data = sanitize_input(data)
         
         attendance_model = Attendance(current_app.db)
-        
-        # Check if record exists
-        existing_record = attendance_model.collection.find_one({
-            '_id': attendance_model.to_object_id(attendance_id)
-        })
-        
-        if not existing_record:
-            return not_found_response("Attendance record not found")
+        attendance_oid = attendance_model.to_object_id(attendance_id)
         
         # Prepare update data
         update_data = {}
         current_user_id = get_jwt_identity()
         
         if 'status' in data:
-            valid_statuses = ['present', 'absent', 'late', 'excused']
-            if data['status'].lower() in valid_statuses:
+            if data['status'].lower() in VALID_ATTENDANCE_STATUSES:
                 update_data['status'] = data['status'].lower()
             else:
                 return validation_error_response({"status": ["Invalid status"]})
@@ -544,27 +562,22 @@ def update_attendance(attendance_id):
         update_data['updated_by'] = current_user_id
         update_data['updated_at'] = datetime.utcnow()
         
-        # Update record
-        result = attendance_model.collection.update_one(
-            {'_id': attendance_model.to_object_id(attendance_id)},
-            {'$set': update_data}
+        # Update record and fetch the new version in one round-trip
+        updated_record = attendance_model.collection.find_one_and_update(
+            {'_id': attendance_oid},
+            {'$set': update_data},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count > 0:
-            # Get updated record
-            updated_record = attendance_model.collection.find_one({
-                '_id': attendance_model.to_object_id(attendance_id)
-            })
-            
-            return success_response(
-                data={'attendance': attendance_model.to_dict(updated_record)},
-                message='Attendance record updated successfully'
-            )
-        else:
-            return success_response(
-                data={},
-                message='No changes made to attendance record'
-            )
+        if not updated_record:
+            return not_found_response("Attendance record not found")
+        
+        invalidate_report_cache()
+        
+        return success_response(
+            data={'attendance': attendance_model.to_dict(updated_record)},
+            message='Attendance record updated successfully'
+        )
             
     except Exception as e:
         return server_error_response("Failed to update attendance")
@@ -599,21 +612,10 @@ def get_attendance_statistics():
                 date_filter['$lte'] = date_to
             filters['date'] = date_filter
         
-        # Get statistics
+        # Get statistics (attendance/absence/tardiness rates are computed by the pipeline)
         attendance_model = Attendance(current_app.db)
         stats = attendance_model.get_statistics(filters)
-        
-        # Calculate additional metrics
-        if stats['total'] > 0:
-            attendance_rate = stats.get('present', 0) / stats['total'] * 100
-            stats['attendance_rate'] = round(attendance_rate, 2)
-            
-            absence_rate = stats.get('absent', 0) / stats['total'] * 100
-            stats['absence_rate'] = round(absence_rate, 2)
-            
-            tardiness_rate = stats.get('late', 0) / stats['total'] * 100
-            stats['tardiness_rate'] = round(tardiness_rate, 2)
-        
+
         return success_response(
             data={
                 'statistics': stats,
@@ -11,20 +11,99 @@ from flask_jwt_extended import (
     get_jwt_identity,
     get_jwt
 )
-from datetime import datetime
+import json
+import logging
 import re
+import time
 
 from app.models import User
 from app.utils.validation import validate_email, validate_password
+from app.utils.response_cache import invalidate_cached_responses
 from app.utils.api_response import (
     success_response, error_response, validation_error_response,
-    unauthorized_response, forbidden_response, server_error_response
+    unauthorized_response, forbidden_response, not_found_response,
+    server_error_response
 )
 
 auth_bp = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
+
+# Revoked token ids are kept in Redis until the token would have expired anyway
+REVOKED_TOKEN_KEY = 'auth:revoked:{jti}'
+
+
+def is_token_revoked(jwt_payload):
+    """Check if a token has been revoked (registered as the JWT blocklist loader)"""
+    return current_app.redis.exists(REVOKED_TOKEN_KEY.format(jti=jwt_payload['jti'])) == 1
+
+
+# Access token claims are rebuilt on every refresh; cache them briefly per user
+CLAIMS_CACHE_KEY = 'auth:claims:{user_id}'
+CLAIMS_CACHE_TTL = 60
+
+# Only login and change_password need the password hash
+CLAIMS_PROJECTION = {'role': 1, 'first_name': 1, 'last_name': 1, 'is_active': 1}
+PROFILE_PROJECTION = {'password': 0}
+
+
+def get_cached_claims(user_id):
+    """Get access token claims for a user, or None if the user is missing/inactive"""
+    key = CLAIMS_CACHE_KEY.format(user_id=user_id)
+    cached = current_app.redis.get(key)
+    if cached:
+        return json.loads(cached)
+    
+    user = current_app.extensions['models'].user.find_by_id(user_id, projection=CLAIMS_PROJECTION)
+    if not user or not user.get('is_active', True):
+        return None
+    
+    claims = {
+        'role': user.get('role', 'teacher'),
+        'first_name': user.get('first_name', ''),
+        'last_name': user.get('last_name', '')
+    }
+    current_app.redis.setex(key, CLAIMS_CACHE_TTL, json.dumps(claims))
+    return claims
+
+
+def invalidate_cached_claims(user_id):
+    """Drop cached claims after a user's profile changes"""
+    current_app.redis.delete(CLAIMS_CACHE_KEY.format(user_id=user_id))
+
+
+# Teacher id -> display name, used to validate class teacher assignments
+TEACHERS_CACHE_KEY = 'users:teachers'
+TEACHERS_CACHE_TTL = 300
+
+
+def get_teacher_name(teacher_id):
+    """Get a teacher's display name, or None if teacher_id is not a teacher"""
+    store = current_app.redis
+    if not store.exists(TEACHERS_CACHE_KEY):
+        teachers = current_app.db.users.find(
+            {'role': 'teacher'}, {'first_name': 1, 'last_name': 1}
+        )
+        names = {
+            str(t['_id']): f"{t.get('first_name', '')} {t.get('last_name', '')}"
+            for t in teachers
+        }
+        if not names:
+            return None
+        store.hset(TEACHERS_CACHE_KEY, mapping=names)
+        store.expire(TEACHERS_CACHE_KEY, TEACHERS_CACHE_TTL)
+    
+    return store.hget(TEACHERS_CACHE_KEY, str(teacher_id))
+
+
+def invalidate_user_list_cache():
+    """Retire cached user listings after users are added, changed or removed"""
+    invalidate_cached_responses('users')
+
+
+def invalidate_teacher_cache():
+    """Drop the cached teacher list after users are added, changed or removed"""
+    current_app.redis.delete(TEACHERS_CACHE_KEY)
 
-# Blacklisted tokens (in production, use Redis or database)
-blacklisted_tokens = set()
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
@@ -46,28 +125,21 @@ def login():
             return validation_error_response(["Invalid email format"])
         
         # Initialize user model
-        user_model = User(current_app.db)
+        user_model = current_app.extensions['models'].user
         
-        # Get user details first
+        # Get user details (including the password hash) in one lookup
         user = user_model.find_by_email(email)
-        print(f"🔍 Login attempt for {email}")
-        print(f"🔍 User found: {user is not None}")
         
         if not user:
-            print(f"❌ User not found for email: {email}")
+            logger.debug("Login failed, user not found: %s", email)
             return unauthorized_response("Invalid email or password")
         
-        print(f"🔍 User active: {user.get('is_active', True)}")
         if not user.get('is_active', True):
             return forbidden_response("Account is deactivated")
         
-        # Verify credentials
-        print(f"🔍 Attempting password verification...")
-        password_valid = user_model.verify_password(email, password)
-        print(f"🔍 Password valid: {password_valid}")
-        
-        if not password_valid:
-            print(f"❌ Invalid password for email: {email}")
+        # Verify credentials against the document we already have
+        if not user_model.check_password(user, password):
+            logger.debug("Login failed, invalid password: %s", email)
             return unauthorized_response("Invalid email or password")
         
         # Create tokens
@@ -78,17 +150,19 @@ def login():
             'last_name': user.get('last_name', '')
         }
         
-        print(f"🔍 Creating tokens for user ID: {user_id}")
         access_token = create_access_token(
             identity=user_id,
             additional_claims=additional_claims
         )
         refresh_token = create_refresh_token(identity=user_id)
         
-        # Update last login
-        user_model.update(user_id, {'last_login': datetime.utcnow()})
+        # Record the login, upgrading a legacy password hash in the same write
+        login_update = {}
+        if user_model.needs_rehash(user['password']):
+            login_update['password'] = user_model.hash_password(password)
+        user_model.update(user_id, login_update, touch=['last_login'])
         
-        print(f"✅ Login successful for {email}")
+        logger.debug("Login successful: %s", email)
         return success_response(
             data={
                 'access_token': access_token,
@@ -106,7 +180,7 @@ def login():
         )
         
     except Exception as e:
-        print(f"❌ Login error: {str(e)}")
+        logger.error("Login error: %s", e)
         return server_error_response("Login failed")
 
 
@@ -142,10 +216,10 @@ def register():
             return validation_error_response(["Invalid role"])
         
         # Initialize user model
-        user_model = User(current_app.db)
+        user_model = current_app.extensions['models'].user
         
         # Check if user already exists
-        existing_user = user_model.find_by_email(email)
+        existing_user = user_model.find_by_email(email, projection={'_id': 1})
         if existing_user:
             return error_response("User with this email already exists", 409)
         
@@ -161,6 +235,9 @@ def register():
         }
         
         created_user = user_model.create(user_data)
+        invalidate_user_list_cache()
+        if role == 'teacher':
+            invalidate_teacher_cache()
         
         return success_response(
             data={
@@ -185,20 +262,13 @@ def refresh():
     try:
         current_user_id = get_jwt_identity()
         
-        # Get user details for claims
-        user_model = User(current_app.db)
-        user = user_model.find_by_id(current_user_id)
+        # Get claims for the new token (cached per user)
+        additional_claims = get_cached_claims(current_user_id)
         
-        if not user or not user.get('is_active', True):
+        if not additional_claims:
             return not_found_response("User not found or inactive")
         
         # Create new access token
-        additional_claims = {
-            'role': user.get('role', 'teacher'),
-            'first_name': user.get('first_name', ''),
-            'last_name': user.get('last_name', '')
-        }
-        
         access_token = create_access_token(
             identity=current_user_id,
             additional_claims=additional_claims
@@ -218,8 +288,9 @@ def refresh():
 def logout():
     """User logout endpoint"""
     try:
-        jti = get_jwt()['jti']
-        blacklisted_tokens.add(jti)
+        jwt_payload = get_jwt()
+        ttl = max(int(jwt_payload['exp'] - time.time()), 1)
+        current_app.redis.set(REVOKED_TOKEN_KEY.format(jti=jwt_payload['jti']), '1', ex=ttl)
         
         return success_response(
             data={},
@@ -237,8 +308,8 @@ def get_profile():
     try:
         current_user_id = get_jwt_identity()
         
-        user_model = User(current_app.db)
-        user = user_model.find_by_id(current_user_id)
+        user_model = current_app.extensions['models'].user
+        user = user_model.find_by_id(current_user_id, projection=PROFILE_PROJECTION)
         
         if not user:
             return not_found_response("User")
@@ -287,35 +358,40 @@ def update_profile():
             if not validate_email(email):
                 return validation_error_response(["Invalid email format"])
             
-            # Check if email is already taken
-            user_model = User(current_app.db)
-            existing = user_model.find_by_email(email)
+            # Check if email is already taken - a match on ourselves means it is unchanged
+            user_model = current_app.extensions['models'].user
+            existing = user_model.find_by_email(email, projection={'_id': 1})
             if existing and existing['id'] != current_user_id:
                 return error_response("Email already taken", 409)
             
-            update_data['email'] = email
+            if not existing:
+                update_data['email'] = email
         
-        if not update_data:
+        if not update_data and 'email' not in data:
             return validation_error_response(["No valid fields to update"])
         
-        # Update user
-        user_model = User(current_app.db)
-        if user_model.update(current_user_id, update_data):
-            updated_user = user_model.find_by_id(current_user_id)
-            return success_response(
-                data={
-                    'user': {
-                        'id': updated_user['id'],
-                        'email': updated_user['email'],
-                        'first_name': updated_user.get('first_name', ''),
-                        'last_name': updated_user.get('last_name', ''),
-                        'role': updated_user.get('role', 'teacher')
-                    }
-                },
-                message='Profile updated successfully'
-            )
-        else:
-            return server_error_response("Failed to update profile")
+        # Update user (nothing to write if only the unchanged email was posted)
+        user_model = current_app.extensions['models'].user
+        if update_data:
+            if not user_model.update(current_user_id, update_data):
+                return server_error_response("Failed to update profile")
+            invalidate_cached_claims(current_user_id)
+            invalidate_teacher_cache()
+            invalidate_user_list_cache()
+        
+        updated_user = user_model.find_by_id(current_user_id, projection=PROFILE_PROJECTION)
+        return success_response(
+            data={
+                'user': {
+                    'id': updated_user['id'],
+                    'email': updated_user['email'],
+                    'first_name': updated_user.get('first_name', ''),
+                    'last_name': updated_user.get('last_name', ''),
+                    'role': updated_user.get('role', 'teacher')
+                }
+            },
+            message='Profile updated successfully'
+        )
             
     except Exception as e:
         return server_error_response("Profile update failed")
@@ -343,21 +419,28 @@ def change_password():
                 "New password must be at least 8 characters with letters and numbers"
             ])
         
-        user_model = User(current_app.db)
-        user = user_model.find_by_id(current_user_id)
+        user_model = current_app.extensions['models'].user
+        user = user_model.find_by_id(current_user_id, projection={'email': 1, 'password': 1})
         
         if not user:
             return not_found_response("User")
         
-        # Verify current password
-        if not user_model.verify_password(user['email'], current_password):
+        # Verify current password against the document we already have
+        if not user_model.check_password(user, current_password):
             return validation_error_response(["Current password is incorrect"])
         
-        # Hash and update new password using werkzeug (consistent with demo data)
-        from werkzeug.security import generate_password_hash
-        password_hash = generate_password_hash(new_password, method='pbkdf2:sha256')
+        # Same password: nothing to hash or write
+        if new_password == current_password:
+            return success_response(
+                data={},
+                message='Password changed successfully'
+            )
+        
+        # Hash and update new password (argon2id, pbkdf2 fallback)
+        password_hash = User.hash_password(new_password)
         
         if user_model.update(current_user_id, {'password': password_hash}):
+            invalidate_cached_claims(current_user_id)
             return success_response(
                 data={},
                 message='Password changed successfully'
@@ -367,9 +450,3 @@ def change_password():
             
     except Exception as e:
         return server_error_response("Password change failed")
-
-# JWT token check callback
-@auth_bp.before_app_request
-def check_if_token_revoked():
-    """Check if token is blacklisted"""
-    pass  # Implement token blacklist check if needed
\ No newline at end of file
@@ -4,16 +4,21 @@ Class Management Routes for Intelligent Attendance Register
 
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from datetime import datetime
+from pymongo import ReturnDocument
+import logging
 
-from app.models import Class, Student, User
 from app.utils.validation import validate_class_data, sanitize_input
+from app.utils.error_handlers import require_role
+from app.routes.auth import get_teacher_name
+from app.routes.students import invalidate_student_cache
+from app.routes.reports import invalidate_report_cache
 from app.utils.api_response import (
     success_response, error_response, validation_error_response,
     not_found_response, forbidden_response, server_error_response
 )
 
 classes_bp = Blueprint('classes', __name__)
+logger = logging.getLogger(__name__)
 
 
 @classes_bp.route('', methods=['GET'])
@@ -25,7 +30,7 @@ def get_classes():
         user_role = claims.get('role')
         current_user_id = get_jwt_identity()
         
-        class_model = Class(current_app.db)
+        class_model = current_app.extensions['models'].cls
         
         # Teachers can only see their own classes
         if user_role == 'teacher':
@@ -40,7 +45,7 @@ def get_classes():
         )
         
     except Exception as e:
-        print(f"❌ Error getting classes: {str(e)}")
+        logger.error("Error getting classes: %s", e)
         return server_error_response("Failed to get classes")
 
 
@@ -49,8 +54,9 @@ def get_classes():
 def get_class(class_id):
     """Get a specific class by ID"""
     try:
-        class_model = Class(current_app.db)
-        cls = class_model.find_by_id(class_id)
+        # Class and its students in one round-trip
+        class_model = current_app.extensions['models'].cls
+        cls = class_model.find_with_students(class_id)
         
         if not cls:
             return not_found_response("Class")
@@ -63,33 +69,22 @@ def get_class(class_id):
         if user_role == 'teacher' and cls.get('teacher_id') != current_user_id:
             return forbidden_response("Access denied")
         
-        # Get students in this class
-        student_model = Student(current_app.db)
-        students = student_model.find_by_class(class_id)
-        
-        cls['students'] = students
-        cls['student_count'] = len(students)
-        
         return success_response(
             data=cls,
             message="Class retrieved successfully"
         )
         
     except Exception as e:
-        print(f"❌ Error getting class {class_id}: {str(e)}")
+        logger.error("Error getting class %s: %s", class_id, e)
         return server_error_response("Failed to get class")
 
 
 @classes_bp.route('', methods=['POST'])
 @jwt_required()
+@require_role('admin', message="Admin access required")
 def create_class():
     """Create a new class (admin only)"""
     try:
-        # Check permissions
-        claims = get_jwt()
-        if claims.get('role') != 'admin':
-            return forbidden_response("Admin access required")
-        
         data = request.get_json()
         if not data:
             return error_response("No data provided")
@@ -102,10 +97,9 @@ def create_class():
         if errors:
             return validation_error_response(errors)
         
-        # Check if teacher exists
-        user_model = User(current_app.db)
-        teacher = user_model.find_by_id(data['teacher_id'])
-        if not teacher or teacher.get('role') != 'teacher':
+        # Check if teacher exists (cached teacher list)
+        teacher_name = get_teacher_name(data['teacher_id'])
+        if not teacher_name:
             return validation_error_response(["Invalid teacher ID"])
         
         # Prepare class data
@@ -114,7 +108,7 @@ def create_class():
             'subject': data['subject'],
             'class_code': data.get('class_code', '').upper(),
             'teacher_id': data['teacher_id'],
-            'teacher_name': f"{teacher['first_name']} {teacher['last_name']}",
+            'teacher_name': teacher_name,
             'grade': data.get('grade', 10),
             'room': data.get('room', ''),
             'schedule': data.get('schedule', {}),  # e.g., {"monday": "09:00-10:00", "wednesday": "14:00-15:00"}
@@ -124,7 +118,7 @@ def create_class():
         }
         
         # Create class
-        class_model = Class(current_app.db)
+        class_model = current_app.extensions['models'].cls
         created_class = class_model.create(class_data)
         
         return success_response(
@@ -134,20 +128,16 @@ def create_class():
         )
         
     except Exception as e:
-        print(f"❌ Error creating class: {str(e)}")
+        logger.error("Error creating class: %s", e)
         return server_error_response("Failed to create class")
 
 
 @classes_bp.route('/<class_id>', methods=['PUT'])
 @jwt_required()
+@require_role('admin', message="Admin access required")
 def update_class(class_id):
     """Update a class (admin only)"""
     try:
-        # Check permissions
-        claims = get_jwt()
-        if claims.get('role') != 'admin':
-            return forbidden_response("Admin access required")
-        
         data = request.get_json()
         if not data:
             return error_response("No data provided")
@@ -155,12 +145,6 @@ def update_class(class_id):
         # Sanitize input
         data = sanitize_input(data)
         
-        # Check if class exists
-        class_model = Class(current_app.db)
-        existing_class = class_model.find_by_id(class_id)
-        if not existing_class:
-            return not_found_response("Class")
-        
         # Prepare update data
         update_data = {}
         
@@ -188,34 +172,31 @@ def update_class(class_id):
         
         # Handle teacher change
         if 'teacher_id' in data:
-            user_model = User(current_app.db)
-            teacher = user_model.find_by_id(data['teacher_id'])
-            if not teacher or teacher.get('role') != 'teacher':
+            teacher_name = get_teacher_name(data['teacher_id'])
+            if not teacher_name:
                 return validation_error_response(["Invalid teacher ID"])
             
             update_data['teacher_id'] = data['teacher_id']
-            update_data['teacher_name'] = f"{teacher['first_name']} {teacher['last_name']}"
+            update_data['teacher_name'] = teacher_name
         
         if not update_data:
             return validation_error_response(["No valid fields to update"])
         
-        # Update class
-        result = class_model.collection.update_one(
+        # Update class and get the new document back in one round-trip
+        class_model = current_app.extensions['models'].cls
+        updated_class = class_model.collection.find_one_and_update(
             {'_id': class_model.to_object_id(class_id)},
-            {'$set': {**update_data, 'updated_at': datetime.utcnow()}}
+            {'$set': update_data, '$currentDate': {'updated_at': True}},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count > 0:
-            updated_class = class_model.find_by_id(class_id)
-            return success_response(
-                data={'class': updated_class},
-                message='Class updated successfully'
-            )
-        else:
-            return success_response(
-                data={},
-                message='No changes made to class'
-            )
+        if not updated_class:
+            return not_found_response("Class")
+        
+        return success_response(
+            data={'class': class_model.to_dict(updated_class)},
+            message='Class updated successfully'
+        )
             
     except Exception as e:
         return server_error_response("Failed to update class")
@@ -226,8 +207,8 @@ def update_class(class_id):
 def get_class_students(class_id):
     """Get all students in a specific class"""
     try:
-        class_model = Class(current_app.db)
-        student_model = Student(current_app.db)
+        class_model = current_app.extensions['models'].cls
+        student_model = current_app.extensions['models'].student
         
         # Check if class exists
         cls = class_model.find_by_id(class_id)
@@ -239,14 +220,9 @@ def get_class_students(class_id):
         user_role = claims.get('role')
         current_user_id = get_jwt_identity()
         
-        print(f"🔍 Class students permission check:")
-        print(f"   - User role: {user_role}")
-        print(f"   - Current user ID: {current_user_id}")
-        print(f"   - Class teacher ID: {cls.get('teacher_id', '')}")
-        print(f"   - Comparison: {str(cls.get('teacher_id', ''))} == {str(current_user_id)}")
-        
-        if user_role == 'teacher' and str(cls.get('teacher_id', '')) != str(current_user_id):
-            print(f"❌ Access denied for teacher {current_user_id} to class {class_id}")
+        # teacher_id is already a string (to_dict) and so is the JWT identity
+        if user_role == 'teacher' and cls.get('teacher_id') != current_user_id:
+            logger.debug("Access denied for teacher %s to class %s", current_user_id, class_id)
             return forbidden_response("Access denied")
         
         # Get students in this class
@@ -272,7 +248,8 @@ def add_student_to_class(class_id):
     try:
         # Check permissions
         claims = get_jwt()
-        if claims.get('role') not in ['admin', 'teacher']:
+        user_role = claims.get('role')
+        if user_role not in ['admin', 'teacher']:
             return forbidden_response("Insufficient permissions")
         
         data = request.get_json()
@@ -282,27 +259,26 @@ def add_student_to_class(class_id):
         student_id = data['student_id']
         
         # Check if class exists
-        class_model = Class(current_app.db)
+        class_model = current_app.extensions['models'].cls
         cls = class_model.find_by_id(class_id)
         if not cls:
             return not_found_response("Class")
         
         # Check permissions for teachers
         current_user_id = get_jwt_identity()
-        if claims.get('role') == 'teacher' and cls.get('teacher_id') != current_user_id:
+        if user_role == 'teacher' and cls.get('teacher_id') != current_user_id:
             return forbidden_response("Access denied")
         
         # Check if student exists
-        student_model = Student(current_app.db)
+        student_model = current_app.extensions['models'].student
         student = student_model.find_by_id(student_id)
         if not student:
             return not_found_response("Student")
         
         # Check class capacity
-        current_students = student_model.find_by_class(class_id)
         max_students = cls.get('max_students', 30)
-        
-        if len(current_students) >= max_students:
+
+        if student_model.count_by_class(class_id) >= max_students:
             return validation_error_response(["Class is at maximum capacity"])
         
         # Check if student is already in the class
@@ -311,6 +287,8 @@ def add_student_to_class(class_id):
         
         # Add student to class
         if student_model.update(student_id, {'class_id': class_id}):
+            invalidate_student_cache()
+            invalidate_report_cache()
             return success_response(
                 data={
                     'student': student,
@@ -332,22 +310,23 @@ def remove_student_from_class(class_id, student_id):
     try:
         # Check permissions
         claims = get_jwt()
-        if claims.get('role') not in ['admin', 'teacher']:
+        user_role = claims.get('role')
+        if user_role not in ['admin', 'teacher']:
             return forbidden_response("Insufficient permissions")
         
         # Check if class exists
-        class_model = Class(current_app.db)
+        class_model = current_app.extensions['models'].cls
         cls = class_model.find_by_id(class_id)
         if not cls:
             return not_found_response("Class")
         
         # Check permissions for teachers
         current_user_id = get_jwt_identity()
-        if claims.get('role') == 'teacher' and cls.get('teacher_id') != current_user_id:
+        if user_role == 'teacher' and cls.get('teacher_id') != current_user_id:
             return forbidden_response("Access denied")
         
         # Check if student exists and is in the class
-        student_model = Student(current_app.db)
+        student_model = current_app.extensions['models'].student
         student = student_model.find_by_id(student_id)
         if not student:
             return not_found_response("Student")
@@ -357,6 +336,8 @@ def remove_student_from_class(class_id, student_id):
         
         # Remove student from class
         if student_model.update(student_id, {'class_id': ''}):
+            invalidate_student_cache()
+            invalidate_report_cache()
             return success_response(
                 data={},
                 message='Student removed from class successfully'
@@ -373,7 +354,7 @@ def remove_student_from_class(class_id, student_id):
 def get_class_schedule(class_id):
     """Get class schedule"""
     try:
-        class_model = Class(current_app.db)
+        class_model = current_app.extensions['models'].cls
         cls = class_model.find_by_id(class_id)
         
         if not cls:
@@ -409,20 +390,21 @@ def get_teacher_classes(teacher_id):
     try:
         # Check permissions
         claims = get_jwt()
+        user_role = claims.get('role')
         current_user_id = get_jwt_identity()
         
         # Teachers can only see their own classes, admins can see any teacher's classes
-        if claims.get('role') == 'teacher' and current_user_id != teacher_id:
+        if user_role == 'teacher' and current_user_id != teacher_id:
             return forbidden_response("Access denied")
         
-        class_model = Class(current_app.db)
+        class_model = current_app.extensions['models'].cls
         classes = class_model.find_by_teacher(teacher_id)
         
         # Add student count for each class
-        student_model = Student(current_app.db)
+        student_model = current_app.extensions['models'].student
+        counts = student_model.count_by_classes([cls['id'] for cls in classes])
         for cls in classes:
-            students = student_model.find_by_class(cls['id'])
-            cls['student_count'] = len(students)
+            cls['student_count'] = counts.get(cls['id'], 0)
         
         return success_response(
             data={
@@ -2,9 +2,13 @@
 Prediction routes for ML-based absence predictions
 """
 
-from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask import Blueprint, request, jsonify, current_app, g
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
 from datetime import datetime, timedelta
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 import os
 
 from app.utils.simple_ml import predict_absence_risk, detect_unusual_patterns
@@ -20,8 +24,8 @@ except ImportError:
     np = None
     
 from app.utils.simple_ml import SimplePredictor, train_simple_model
+from app.utils.attendance_kernels import scan_absences, absence_flags
 
-from app.models import Attendance, Student
 from app.utils.api_response import (
     success_response, error_response, validation_error_response,
     not_found_response, forbidden_response, server_error_response
@@ -29,147 +33,304 @@ from app.utils.api_response import (
 
 predictions_bp = Blueprint('predictions', __name__)
 
-# Cache for loaded ML models
-_models_cache = {}
+# Roles allowed to use any prediction endpoint
+PREDICTION_ROLES = frozenset(('admin', 'teacher'))
+
+
+@predictions_bp.before_request
+def load_prediction_claims():
+    """Verify the JWT once per request and reject other roles before any view work"""
+    if request.method == 'OPTIONS':
+        return None
+    
+    verify_jwt_in_request()
+    g.claims = get_jwt()
+    if g.claims.get('role') not in PREDICTION_ROLES:
+        return forbidden_response("Insufficient permissions")
+
+# Model input columns, in training order
+FEATURE_NAMES = (
+    'grade', 'day_of_week', 'month', 'day_of_month',
+    'attendance_rate_30d', 'absence_rate_30d', 'tardiness_rate_30d',
+    'recent_absence_rate', 'consecutive_absences',
+    'is_weekend', 'is_monday', 'is_friday',
+    'is_winter', 'is_spring', 'is_fall'
+)
+
+# C-level extraction of the feature columns; build_prediction_features always sets all of them
+feature_values = itemgetter(*FEATURE_NAMES)
+
+
+@lru_cache(maxsize=4)
+def _load_model_file(model_path, mtime):
+    """Load a model file; cached per (path, mtime) so a replaced file is reloaded"""
+    return joblib.load(model_path)
 
 
 def load_ml_model(model_name='absence_predictor.pkl'):
     """Load ML model with caching"""
-    if model_name in _models_cache:
-        return _models_cache[model_name]
-    
     try:
         model_path = os.path.join(
             current_app.config.get('ML_MODEL_PATH', '/app/models'),
             model_name
         )
         
-        if not os.path.exists(model_path):
+        # One stat both checks existence and keys the cache
+        try:
+            mtime = os.stat(model_path).st_mtime
+        except FileNotFoundError:
             return None
         
-        model = joblib.load(model_path)
-        _models_cache[model_name] = model
-        return model
+        return _load_model_file(model_path, mtime)
     
     except Exception as e:
         print(f"Error loading model {model_name}: {e}")
         return None
 
 
+INVALID_DATE_MESSAGE = "Invalid date format, use YYYY-MM-DD"
+
+
+@lru_cache(maxsize=64)
+def _history_window(date_str):
+    """Parse a prediction date once: (target date, window start, window end, recent cutoff)"""
+    target_date = datetime.strptime(date_str, '%Y-%m-%d')
+    end_date = target_date - timedelta(days=1)
+    start_date = end_date - timedelta(days=30)
+    recent_cutoff = target_date - timedelta(days=7)
+    return (
+        target_date,
+        start_date.strftime('%Y-%m-%d'),
+        end_date.strftime('%Y-%m-%d'),
+        recent_cutoff.strftime('%Y-%m-%d')
+    )
+
+
+def _valid_prediction_date(date_str):
+    """Whether a request's prediction date parses as YYYY-MM-DD"""
+    try:
+        _history_window(date_str)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def build_prediction_features(student, target_date, totals, recent_statuses):
+    """Build the feature dict from a student, window totals and recent statuses (newest first)"""
+    features = {}
+    
+    # Basic student features
+    features['grade'] = student.get('grade', 10)
+    features['day_of_week'] = target_date.weekday()  # 0=Monday, 6=Sunday
+    features['month'] = target_date.month
+    features['day_of_month'] = target_date.day
+    
+    # Historical attendance features
+    if totals:
+        total_records = totals['total']
+        absent_count = totals['absent']
+        late_count = totals['late']
+        
+        features['attendance_rate_30d'] = (total_records - absent_count) / max(total_records, 1)
+        features['absence_rate_30d'] = absent_count / max(total_records, 1)
+        features['tardiness_rate_30d'] = late_count / max(total_records, 1)
+        
+        # Recent pattern (last 7 days)
+        if recent_statuses:
+            recent_absent = recent_statuses.count('absent')
+            features['recent_absence_rate'] = recent_absent / len(recent_statuses)
+            
+            # Consecutive absences (statuses are already newest first)
+            consecutive_absences = 0
+            for status in recent_statuses:
+                if status == 'absent':
+                    consecutive_absences += 1
+                else:
+                    break
+            features['consecutive_absences'] = consecutive_absences
+        else:
+            features['recent_absence_rate'] = 0
+            features['consecutive_absences'] = 0
+    else:
+        # No history available
+        features['attendance_rate_30d'] = 1.0
+        features['absence_rate_30d'] = 0.0
+        features['tardiness_rate_30d'] = 0.0
+        features['recent_absence_rate'] = 0.0
+        features['consecutive_absences'] = 0
+    
+    # Day type features (weekday vs weekend - though school is typically weekdays)
+    features['is_weekend'] = 1 if target_date.weekday() >= 5 else 0
+    features['is_monday'] = 1 if target_date.weekday() == 0 else 0
+    features['is_friday'] = 1 if target_date.weekday() == 4 else 0
+    
+    # Seasonal features
+    features['is_winter'] = 1 if target_date.month in [12, 1, 2] else 0
+    features['is_spring'] = 1 if target_date.month in [3, 4, 5] else 0
+    features['is_fall'] = 1 if target_date.month in [9, 10, 11] else 0
+    
+    return features
+
+
 def prepare_prediction_features(student_id, date_str=None):
     """Prepare features for absence prediction"""
     try:
         if not date_str:
             date_str = datetime.now().strftime('%Y-%m-%d')
         
-        target_date = datetime.strptime(date_str, '%Y-%m-%d')
+        target_date, start_str, end_str, recent_cutoff = _history_window(date_str)
         
         # Get student information
-        student_model = Student(current_app.db)
+        student_model = current_app.extensions['models'].student
         student = student_model.find_by_id(student_id)
         
         if not student:
             return None
         
         # Get attendance history (last 30 days)
-        attendance_model = Attendance(current_app.db)
-        end_date = target_date - timedelta(days=1)
-        start_date = end_date - timedelta(days=30)
+        attendance_model = current_app.extensions['models'].attendance
         
         history_filter = {
             'student_id': student_id,
-            'date': {
-                '$gte': start_date.strftime('%Y-%m-%d'),
-                '$lte': end_date.strftime('%Y-%m-%d')
-            }
+            'date': {'$gte': start_str, '$lte': end_str}
         }
         
-        attendance_records = list(attendance_model.collection.find(history_filter))
-        
-        # Calculate features
-        features = {}
-        
-        # Basic student features
-        features['grade'] = student.get('grade', 10)
-        features['day_of_week'] = target_date.weekday()  # 0=Monday, 6=Sunday
-        features['month'] = target_date.month
-        features['day_of_month'] = target_date.day
-        
-        # Historical attendance features
-        if attendance_records:
-            total_records = len(attendance_records)
-            absent_count = sum(1 for r in attendance_records if r.get('status') == 'absent')
-            late_count = sum(1 for r in attendance_records if r.get('status') == 'late')
-            
-            features['attendance_rate_30d'] = (total_records - absent_count) / max(total_records, 1)
-            features['absence_rate_30d'] = absent_count / max(total_records, 1)
-            features['tardiness_rate_30d'] = late_count / max(total_records, 1)
-            
-            # Recent pattern (last 7 days)
-            recent_records = [r for r in attendance_records 
-                            if datetime.strptime(r['date'], '%Y-%m-%d') >= target_date - timedelta(days=7)]
-            
-            if recent_records:
-                recent_absent = sum(1 for r in recent_records if r.get('status') == 'absent')
-                features['recent_absence_rate'] = recent_absent / len(recent_records)
-                
-                # Consecutive absences
-                sorted_recent = sorted(recent_records, key=lambda x: x['date'], reverse=True)
-                consecutive_absences = 0
-                for record in sorted_recent:
-                    if record.get('status') == 'absent':
-                        consecutive_absences += 1
-                    else:
-                        break
-                features['consecutive_absences'] = consecutive_absences
-            else:
-                features['recent_absence_rate'] = 0
-                features['consecutive_absences'] = 0
-        else:
-            # No history available
-            features['attendance_rate_30d'] = 1.0
-            features['absence_rate_30d'] = 0.0
-            features['tardiness_rate_30d'] = 0.0
-            features['recent_absence_rate'] = 0.0
-            features['consecutive_absences'] = 0
-        
-        # Day type features (weekday vs weekend - though school is typically weekdays)
-        features['is_weekend'] = 1 if target_date.weekday() >= 5 else 0
-        features['is_monday'] = 1 if target_date.weekday() == 0 else 0
-        features['is_friday'] = 1 if target_date.weekday() == 4 else 0
-        
-        # Seasonal features
-        features['is_winter'] = 1 if target_date.month in [12, 1, 2] else 0
-        features['is_spring'] = 1 if target_date.month in [3, 4, 5] else 0
-        features['is_fall'] = 1 if target_date.month in [9, 10, 11] else 0
+        # Totals for the window plus the last 7 days (newest first) in one round-trip
+        pipeline = [
+            {'$match': history_filter},
+            {
+                '$facet': {
+                    'totals': [
+                        {
+                            '$group': {
+                                '_id': None,
+                                'total': {'$sum': 1},
+                                'absent': {'$sum': {'$cond': [{'$eq': ['$status', 'absent']}, 1, 0]}},
+                                'late': {'$sum': {'$cond': [{'$eq': ['$status', 'late']}, 1, 0]}}
+                            }
+                        }
+                    ],
+                    'recent': [
+                        {'$match': {'date': {'$gte': recent_cutoff}}},
+                        {'$sort': {'date': -1}},
+                        {'$project': {'_id': 0, 'status': 1}}
+                    ]
+                }
+            }
+        ]
+        history = next(attendance_model.collection.aggregate(pipeline))
+        totals = history['totals'][0] if history['totals'] else None
+        recent_statuses = [r.get('status') for r in history['recent']]
         
-        return features
+        return build_prediction_features(student, target_date, totals, recent_statuses)
     
     except Exception as e:
         print(f"Error preparing features: {e}")
         return None
 
 
+# Shared pool for overlapping independent MongoDB round-trips (I/O releases the GIL)
+_query_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='predictions-query')
+
+
+def prepare_batch_prediction_features(student_ids, date_str=None):
+    """Prepare features for several students with one student query and one aggregation.
+    
+    Returns a dict of student_id -> features; students that do not exist are left out.
+    """
+    if not date_str:
+        date_str = datetime.now().strftime('%Y-%m-%d')
+    
+    target_date, start_str, end_str, recent_cutoff = _history_window(date_str)
+    
+    student_model = current_app.extensions['models'].student
+    attendance_model = current_app.extensions['models'].attendance
+    
+    def load_students():
+        return {
+            str(s['_id']): s
+            for s in student_model.collection.find(
+                {'_id': {'$in': [student_model.to_object_id(sid) for sid in student_ids]}},
+                {'grade': 1}
+            )
+        }
+    
+    # Per-student totals and recent statuses (newest first)
+    pipeline = [
+        {
+            '$match': {
+                'student_id': {'$in': [str(sid) for sid in student_ids]},
+                'date': {'$gte': start_str, '$lte': end_str}
+            }
+        },
+        {'$sort': {'date': -1}},
+        {
+            '$group': {
+                '_id': '$student_id',
+                'total': {'$sum': 1},
+                'absent': {'$sum': {'$cond': [{'$eq': ['$status', 'absent']}, 1, 0]}},
+                'late': {'$sum': {'$cond': [{'$eq': ['$status', 'late']}, 1, 0]}},
+                'records': {'$push': {'date': '$date', 'status': '$status'}}
+            }
+        },
+        {
+            '$project': {
+                'total': 1,
+                'absent': 1,
+                'late': 1,
+                'recent': {
+                    '$map': {
+                        'input': {
+                            '$filter': {
+                                'input': '$records',
+                                'as': 'r',
+                                'cond': {'$gte': ['$$r.date', recent_cutoff]}
+                            }
+                        },
+                        'as': 'r',
+                        'in': '$$r.status'
+                    }
+                }
+            }
+        }
+    ]
+    def load_history():
+        return {
+            doc['_id']: doc
+            for doc in attendance_model.collection.aggregate(pipeline)
+        }
+    
+    # The two queries are independent - overlap their round-trips
+    students_future = _query_pool.submit(load_students)
+    history = load_history()
+    students = students_future.result()
+    
+    features_by_student = {}
+    for student_id, student in students.items():
+        stats = history.get(student_id)
+        features_by_student[student_id] = build_prediction_features(
+            student, target_date, stats, stats['recent'] if stats else []
+        )
+    return features_by_student
+
+
 @predictions_bp.route('/absence', methods=['POST'])
-@jwt_required()
 def predict_absence():
     """Predict absence probability for a student"""
     try:
-        # Check permissions
-        claims = get_jwt()
-        if claims.get('role') not in ['admin', 'teacher']:
-            return forbidden_response("Insufficient permissions")
-        
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if not data:
             return error_response("No data provided")
         
         student_id = data.get('student_id')
-        date_str = data.get('date')  # Optional, defaults to tomorrow
+        date_str = data.get('date') or datetime.now().strftime('%Y-%m-%d')  # Optional, defaults to today
         
         if not student_id:
             return validation_error_response(["student_id is required"])
         
+        if not _valid_prediction_date(date_str):
+            return validation_error_response([INVALID_DATE_MESSAGE])
+        
         # Load ML model
         model = load_ml_model('absence_predictor.pkl')
         if not model:
@@ -182,15 +343,7 @@ def predict_absence():
             return server_error_response("Could not prepare prediction features")
         
         # Convert features to the format expected by the model
-        feature_names = [
-            'grade', 'day_of_week', 'month', 'day_of_month',
-            'attendance_rate_30d', 'absence_rate_30d', 'tardiness_rate_30d',
-            'recent_absence_rate', 'consecutive_absences',
-            'is_weekend', 'is_monday', 'is_friday',
-            'is_winter', 'is_spring', 'is_fall'
-        ]
-        
-        feature_vector = np.array([[features.get(name, 0) for name in feature_names]])
+        feature_vector = np.asarray(feature_values(features), dtype=np.float32).reshape(1, -1)
         
         # Make prediction
         try:
@@ -216,18 +369,18 @@ def predict_absence():
             risk_level = 'low'
         
         # Get student info
-        student_model = Student(current_app.db)
+        student_model = current_app.extensions['models'].student
         student = student_model.find_by_id(student_id)
         
         return success_response(
             data={
                 'student_id': student_id,
                 'student_name': f"{student['first_name']} {student['last_name']}" if student else 'Unknown',
-                'prediction_date': date_str or datetime.now().strftime('%Y-%m-%d'),
+                'prediction_date': date_str,
                 'absence_probability': round(absence_probability, 4),
                 'risk_level': risk_level,
                 'confidence': 'model_based',
-                'features_used': len(feature_names),
+                'features_used': len(FEATURE_NAMES),
                 'recommendation': get_recommendation(risk_level, absence_probability)
             },
             message="Absence prediction completed successfully"
@@ -240,8 +393,8 @@ def predict_absence():
 def predict_absence_fallback(student_id, date_str=None):
     """Fallback prediction based on historical patterns"""
     try:
-        attendance_model = Attendance(current_app.db)
-        student_model = Student(current_app.db)
+        attendance_model = current_app.extensions['models'].attendance
+        student_model = current_app.extensions['models'].student
         
         # Get student
         student = student_model.find_by_id(student_id)
@@ -250,34 +403,38 @@ def predict_absence_fallback(student_id, date_str=None):
         
         # Get recent attendance history (last 14 days)
         end_date = datetime.now() - timedelta(days=1)
-        start_date = end_date - timedelta(days=14)
+        start_str = (end_date - timedelta(days=14)).strftime('%Y-%m-%d')
+        end_str = end_date.strftime('%Y-%m-%d')
         
         history_filter = {
             'student_id': student_id,
-            'date': {
-                '$gte': start_date.strftime('%Y-%m-%d'),
-                '$lte': end_date.strftime('%Y-%m-%d')
-            }
+            'date': {'$gte': start_str, '$lte': end_str}
         }
         
-        recent_records = list(attendance_model.collection.find(history_filter))
+        # Stream newest-first records, counting as we go instead of building a list
+        cursor = attendance_model.collection.find(
+            history_filter, {'_id': 0, 'status': 1}
+        ).sort('date', -1).batch_size(256)
+        
+        total_records = 0
+        absent_count = 0
+        consecutive_absences = 0
+        in_streak = True
+        for record in cursor:
+            total_records += 1
+            if record.get('status') == 'absent':
+                absent_count += 1
+                if in_streak:
+                    consecutive_absences += 1
+            else:
+                in_streak = False
         
-        if not recent_records:
+        if not total_records:
             # No history, assume low risk
             absence_probability = 0.1
         else:
             # Calculate absence rate from recent history
-            absent_count = sum(1 for r in recent_records if r.get('status') == 'absent')
-            absence_probability = absent_count / len(recent_records)
-            
-            # Adjust based on consecutive absences
-            sorted_records = sorted(recent_records, key=lambda x: x['date'], reverse=True)
-            consecutive_absences = 0
-            for record in sorted_records:
-                if record.get('status') == 'absent':
-                    consecutive_absences += 1
-                else:
-                    break
+            absence_probability = absent_count / total_records
             
             # Increase probability if there are consecutive absences
             if consecutive_absences > 0:
@@ -299,7 +456,7 @@ def predict_absence_fallback(student_id, date_str=None):
                 'absence_probability': round(absence_probability, 4),
                 'risk_level': risk_level,
                 'confidence': 'historical_pattern',
-                'historical_records': len(recent_records),
+                'historical_records': total_records,
                 'recommendation': get_recommendation(risk_level, absence_probability)
             },
             message="Fallback prediction completed successfully"
@@ -309,39 +466,50 @@ def predict_absence_fallback(student_id, date_str=None):
         return server_error_response("Fallback prediction failed")
 
 
-def get_recommendation(risk_level, probability):
+# Batch risk thresholds: >= 0.7 high, >= 0.4 medium, otherwise low
+RISK_LABELS = ('high', 'medium', 'low')
+RISK_LABEL_ARRAY = np.array(RISK_LABELS) if np is not None else None
+
+
+def classify_risk_levels(probabilities):
+    """Risk level for each batch absence probability, vectorized when numpy is available"""
+    if np is None:
+        return [RISK_LABELS[0 if p >= 0.7 else 1 if p >= 0.4 else 2] for p in probabilities]
+    
+    probs = np.asarray(probabilities, dtype=float)
+    return RISK_LABEL_ARRAY[np.where(probs >= 0.7, 0, np.where(probs >= 0.4, 1, 2))].tolist()
+
+
+# Recommendations per risk level, built once and shared by every response
+RECOMMENDATIONS = {
+    'high': {
+        'action': 'contact_parent',
+        'message': 'High absence risk detected. Consider contacting parent/guardian.',
+        'urgency': 'high'
+    },
+    'medium': {
+        'action': 'monitor_closely',
+        'message': 'Moderate absence risk. Monitor student closely and be prepared to intervene.',
+        'urgency': 'medium'
+    },
+    'low': {
+        'action': 'normal_monitoring',
+        'message': 'Low absence risk. Continue normal attendance monitoring.',
+        'urgency': 'low'
+    }
+}
+
+
+def get_recommendation(risk_level, probability=None):
     """Get recommendation based on risk level"""
-    if risk_level == 'high':
-        return {
-            'action': 'contact_parent',
-            'message': 'High absence risk detected. Consider contacting parent/guardian.',
-            'urgency': 'high'
-        }
-    elif risk_level == 'medium':
-        return {
-            'action': 'monitor_closely',
-            'message': 'Moderate absence risk. Monitor student closely and be prepared to intervene.',
-            'urgency': 'medium'
-        }
-    else:
-        return {
-            'action': 'normal_monitoring',
-            'message': 'Low absence risk. Continue normal attendance monitoring.',
-            'urgency': 'low'
-        }
+    return RECOMMENDATIONS.get(risk_level, RECOMMENDATIONS['low'])
 
 
 @predictions_bp.route('/batch', methods=['POST'])
-@jwt_required()
 def batch_predict_absence():
     """Predict absence for multiple students"""
     try:
-        # Check permissions
-        claims = get_jwt()
-        if claims.get('role') not in ['admin', 'teacher']:
-            return forbidden_response("Insufficient permissions")
-        
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if not data or 'student_ids' not in data:
             return validation_error_response(["student_ids list is required"])
         
@@ -351,58 +519,55 @@ def batch_predict_absence():
         if not isinstance(student_ids, list):
             return validation_error_response(["student_ids must be a list"])
         
-        predictions = []
+        date_str = date_str or datetime.now().strftime('%Y-%m-%d')
+        if not _valid_prediction_date(date_str):
+            return validation_error_response([INVALID_DATE_MESSAGE])
+        
         errors = []
         
+        # Features for every student from one student query and one aggregation
+        features_by_student = prepare_batch_prediction_features(student_ids, date_str)
+        
+        ready_ids = []
         for student_id in student_ids:
-            try:
-                # Prepare features
-                features = prepare_prediction_features(student_id, date_str)
-                if not features:
-                    errors.append({'student_id': student_id, 'error': 'Could not prepare features'})
-                    continue
-                
-                # Load model and predict (or use fallback)
-                model = load_ml_model('absence_predictor.pkl')
-                
-                if model:
-                    # Use ML model
-                    feature_names = [
-                        'grade', 'day_of_week', 'month', 'day_of_month',
-                        'attendance_rate_30d', 'absence_rate_30d', 'tardiness_rate_30d',
-                        'recent_absence_rate', 'consecutive_absences',
-                        'is_weekend', 'is_monday', 'is_friday',
-                        'is_winter', 'is_spring', 'is_fall'
-                    ]
-                    
-                    feature_vector = np.array([[features.get(name, 0) for name in feature_names]])
-                    
-                    if hasattr(model, 'predict_proba'):
-                        probabilities = model.predict_proba(feature_vector)[0]
-                        absence_probability = probabilities[1] if len(probabilities) > 1 else probabilities[0]
-                    else:
-                        prediction = model.predict(feature_vector)[0]
-                        absence_probability = float(prediction)
-                else:
-                    # Use fallback method
-                    absence_probability = features['absence_rate_30d']
+            if student_id in features_by_student:
+                ready_ids.append(student_id)
+            else:
+                errors.append({'student_id': student_id, 'error': 'Could not prepare features'})
+        
+        # Load the model once and score the whole batch in one call (or use fallback)
+        model = load_ml_model('absence_predictor.pkl')
+        
+        try:
+            if not ready_ids:
+                probabilities = []
+            elif model:
+                feature_matrix = np.array(
+                    [feature_values(features_by_student[sid]) for sid in ready_ids],
+                    dtype=np.float32
+                )
                 
-                # Classify risk
-                if absence_probability >= 0.7:
-                    risk_level = 'high'
-                elif absence_probability >= 0.4:
-                    risk_level = 'medium'
+                if hasattr(model, 'predict_proba'):
+                    proba = model.predict_proba(feature_matrix)
+                    probabilities = proba[:, 1] if proba.shape[1] > 1 else proba[:, 0]
                 else:
-                    risk_level = 'low'
-                
-                predictions.append({
-                    'student_id': student_id,
-                    'absence_probability': round(absence_probability, 4),
-                    'risk_level': risk_level
-                })
-                
-            except Exception as e:
-                errors.append({'student_id': student_id, 'error': str(e)})
+                    probabilities = model.predict(feature_matrix).astype(float)
+            else:
+                # Use fallback method
+                probabilities = [features_by_student[sid]['absence_rate_30d'] for sid in ready_ids]
+        except Exception as e:
+            errors.extend({'student_id': sid, 'error': str(e)} for sid in ready_ids)
+            ready_ids, probabilities = [], []
+        
+        risk_levels = classify_risk_levels(probabilities)
+        predictions = [
+            {
+                'student_id': student_id,
+                'absence_probability': round(float(absence_probability), 4),
+                'risk_level': risk_level
+            }
+            for student_id, absence_probability, risk_level in zip(ready_ids, probabilities, risk_levels)
+        ]
         
         return success_response(
             data={
@@ -422,7 +587,6 @@ def batch_predict_absence():
 
 
 @predictions_bp.route('/patterns/unusual', methods=['GET'])
-@jwt_required()
 def detect_unusual_patterns():
     """Detect unusual attendance patterns"""
     try:
@@ -430,27 +594,24 @@ def detect_unusual_patterns():
         days_back = int(request.args.get('days_back', 30))
         min_records = int(request.args.get('min_records', 5))
         
-        attendance_model = Attendance(current_app.db)
-        student_model = Student(current_app.db)
+        attendance_model = current_app.extensions['models'].attendance
+        student_model = current_app.extensions['models'].student
         
-        # Date range for analysis
+        # Date range for analysis (ISO strings compare in date order)
         end_date = datetime.now()
-        start_date = end_date - timedelta(days=days_back)
+        start_str = (end_date - timedelta(days=days_back)).strftime('%Y-%m-%d')
+        end_str = end_date.strftime('%Y-%m-%d')
         
         # Get all attendance records in the period
-        date_filter = {
-            'date': {
-                '$gte': start_date.strftime('%Y-%m-%d'),
-                '$lte': end_date.strftime('%Y-%m-%d')
-            }
-        }
+        date_filter = {'date': {'$gte': start_str, '$lte': end_str}}
         
         # Aggregate attendance by student
         pipeline = [
             {'$match': date_filter},
             {
                 '$group': {
-                    '_id': '$student_id',
+                    # Always a string key, even for records written with an ObjectId
+                    '_id': {'$toString': '$student_id'},
                     'total_records': {'$sum': 1},
                     'absent_count': {
                         '$sum': {'$cond': [{'$eq': ['$status', 'absent']}, 1, 0]}
@@ -458,7 +619,7 @@ def detect_unusual_patterns():
                     'late_count': {
                         '$sum': {'$cond': [{'$eq': ['$status', 'late']}, 1, 0]}
                     },
-                    'records': {'$push': '$$ROOT'}
+                    'records': {'$push': {'date': '$date', 'status': '$status'}}
                 }
             },
             {'$match': {'total_records': {'$gte': min_records}}}
@@ -467,18 +628,43 @@ def detect_unusual_patterns():
         student_stats = list(attendance_model.collection.aggregate(pipeline))
         
         unusual_patterns = []
-        
-        for stats in student_stats:
+        high_counts = []  # high-severity pattern count per entry, kept in step
+        
+        # Rates for every student at once; only students with an absence or high
+        # tardiness can match any pattern, so the rest are never visited
+        if np is not None and student_stats:
+            count = len(student_stats)
+            totals = np.fromiter((s['total_records'] for s in student_stats), np.float64, count)
+            absents = np.fromiter((s['absent_count'] for s in student_stats), np.float64, count)
+            lates = np.fromiter((s['late_count'] for s in student_stats), np.float64, count)
+            absence_rates = absents / totals
+            tardiness_rates = lates / totals
+            flagged = np.flatnonzero((absents > 0) | (tardiness_rates > 0.25))
+            candidates = [
+                (student_stats[i], float(absence_rates[i]), float(tardiness_rates[i]))
+                for i in flagged
+            ]
+        else:
+            candidates = [
+                (s, s['absent_count'] / s['total_records'], s['late_count'] / s['total_records'])
+                for s in student_stats
+            ]
+            candidates = [c for c in candidates if c[0]['absent_count'] > 0 or c[2] > 0.25]
+        
+        # Student info for every candidate in one round-trip
+        student_projection = {'first_name': 1, 'last_name': 1, 'grade': 1, 'student_id': 1}
+        candidate_ids = [student_model.to_object_id(stats['_id']) for stats, _, _ in candidates]
+        students_by_id = {
+            str(doc['_id']): doc
+            for doc in student_model.collection.find({'_id': {'$in': candidate_ids}}, student_projection)
+        } if candidate_ids else {}
+        
+        for stats, absence_rate, tardiness_rate in candidates:
             student_id = stats['_id']
             total_records = stats['total_records']
-            absent_count = stats['absent_count']
-            late_count = stats['late_count']
-            
-            absence_rate = absent_count / total_records
-            tardiness_rate = late_count / total_records
             
             # Get student info
-            student = student_model.find_by_id(student_id)
+            student = students_by_id.get(student_id)
             if not student:
                 continue
             
@@ -502,17 +688,11 @@ def detect_unusual_patterns():
                     'value': tardiness_rate
                 })
             
-            # Check for consecutive absences
+            # Consecutive absences and first/second half absences in one pass
             records = sorted(stats['records'], key=lambda x: x['date'])
-            consecutive_absences = 0
-            max_consecutive = 0
-            
-            for record in records:
-                if record['status'] == 'absent':
-                    consecutive_absences += 1
-                    max_consecutive = max(max_consecutive, consecutive_absences)
-                else:
-                    consecutive_absences = 0
+            max_consecutive, first_half_absences, second_half_absences = scan_absences(
+                absence_flags(records)
+            )
             
             if max_consecutive >= 3:
                 patterns_detected.append({
@@ -524,8 +704,6 @@ def detect_unusual_patterns():
             
             # Sudden increase in absences (comparing first half to second half)
             mid_point = len(records) // 2
-            first_half_absences = sum(1 for r in records[:mid_point] if r['status'] == 'absent')
-            second_half_absences = sum(1 for r in records[mid_point:] if r['status'] == 'absent')
             
             if mid_point > 0:
                 first_half_rate = first_half_absences / mid_point
@@ -540,9 +718,10 @@ def detect_unusual_patterns():
                     })
             
             if patterns_detected:
+                high_counts.append(sum(1 for p in patterns_detected if p['severity'] == 'high'))
                 unusual_patterns.append({
                     'student': {
-                        'id': student['id'],
+                        'id': student_id,
                         'name': f"{student['first_name']} {student['last_name']}",
                         'grade': student.get('grade'),
                         'student_id': student.get('student_id')
@@ -556,22 +735,23 @@ def detect_unusual_patterns():
                     }
                 })
         
-        # Sort by severity (high severity first)
-        unusual_patterns.sort(key=lambda x: len([p for p in x['patterns'] if p['severity'] == 'high']), reverse=True)
+        # Sort by severity (high severity first), using the counts taken while building
+        ranked = sorted(zip(high_counts, unusual_patterns), key=itemgetter(0), reverse=True)
+        unusual_patterns = [entry for _, entry in ranked]
+        high_severity_cases = sum(1 for count in high_counts if count)
         
         return success_response(
             data={
                 'unusual_patterns': unusual_patterns,
                 'analysis_period': {
-                    'start_date': start_date.strftime('%Y-%m-%d'),
-                    'end_date': end_date.strftime('%Y-%m-%d'),
+                    'start_date': start_str,
+                    'end_date': end_str,
                     'days_analyzed': days_back
                 },
                 'summary': {
                     'students_analyzed': len(student_stats),
                     'unusual_patterns_found': len(unusual_patterns),
-                    'high_severity_cases': len([p for p in unusual_patterns 
-                                              if any(pattern['severity'] == 'high' for pattern in p['patterns'])])
+                    'high_severity_cases': high_severity_cases
                 }
             },
             message="Unusual patterns analysis completed"
@@ -582,29 +762,21 @@ def detect_unusual_patterns():
 
 
 @predictions_bp.route('/class/<class_id>', methods=['GET'])
-@jwt_required()
 def get_class_predictions(class_id):
     """Get predictions for students in a specific class"""
     try:
-        # Check permissions
-        claims = get_jwt()
         current_user_id = get_jwt_identity()
         
-        if claims.get('role') not in ['admin', 'teacher']:
-            return forbidden_response("Insufficient permissions")
-        
         # If teacher, verify they teach this class
-        if claims.get('role') == 'teacher':
-            from app.models import Class
-            class_model = Class(current_app.db)
+        if g.claims.get('role') == 'teacher':
+            class_model = current_app.extensions['models'].cls
             class_doc = class_model.find_by_id(class_id)
             
             if not class_doc or str(class_doc.get('teacher_id')) != current_user_id:
                 return forbidden_response("Access denied to this class")
         
         # Get students in the class
-        from app.models import Student
-        student_model = Student(current_app.db)
+        student_model = current_app.extensions['models'].student
         students = student_model.find_by_class(class_id)
         
         if not students:
@@ -622,68 +794,85 @@ def get_class_predictions(class_id):
                 message='No students found in this class'
             )
         
+        # Attendance counts for every student in the class in one aggregation
+        attendance_model = current_app.extensions['models'].attendance
+        
+        # Look at last 30 days; "recent" is the last 7
+        end_date = datetime.now()
+        start_str = (end_date - timedelta(days=30)).strftime('%Y-%m-%d')
+        end_str = end_date.strftime('%Y-%m-%d')
+        recent_start_str = (end_date - timedelta(days=7)).strftime('%Y-%m-%d')
+        
+        pipeline = [
+            {
+                '$match': {
+                    'student_id': {'$in': [student['id'] for student in students]},
+                    'date': {'$gte': start_str, '$lte': end_str}
+                }
+            },
+            {
+                '$group': {
+                    '_id': '$student_id',
+                    'total': {'$sum': 1},
+                    'present': {'$sum': {'$cond': [{'$eq': ['$status', 'present']}, 1, 0]}},
+                    'recent_absent': {
+                        '$sum': {
+                            '$cond': [
+                                {'$and': [
+                                    {'$gt': ['$date', recent_start_str]},
+                                    {'$eq': ['$status', 'absent']}
+                                ]},
+                                1,
+                                0
+                            ]
+                        }
+                    }
+                }
+            }
+        ]
+        counts_by_student = {
+            doc['_id']: doc
+            for doc in attendance_model.collection.aggregate(pipeline)
+        }
+        
         # Generate simple predictions for each student
         predictions = []
         for student in students:
-            try:
-                # Get recent attendance for this student
-                attendance_model = Attendance(current_app.db)
-                
-                # Look at last 30 days
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=30)
-                
-                student_attendance = attendance_model.find({
-                    'student_id': student['id'],
-                    'date': {
-                        '$gte': start_date.strftime('%Y-%m-%d'),
-                        '$lte': end_date.strftime('%Y-%m-%d')
-                    }
-                })
+            counts = counts_by_student.get(student['id'])
+            
+            # Calculate attendance rate
+            total_records = counts['total'] if counts else 0
+            if total_records == 0:
+                attendance_rate = 1.0  # Default to good attendance if no records
+                risk_level = 'low'
+            else:
+                attendance_rate = counts['present'] / total_records
                 
-                # Calculate attendance rate
-                total_records = len(student_attendance)
-                if total_records == 0:
-                    attendance_rate = 1.0  # Default to good attendance if no records
+                # Simple risk assessment
+                if attendance_rate >= 0.9:
                     risk_level = 'low'
+                elif attendance_rate >= 0.7:
+                    risk_level = 'medium'
                 else:
-                    present_count = len([a for a in student_attendance if a['status'] == 'present'])
-                    attendance_rate = present_count / total_records
-                    
-                    # Simple risk assessment
-                    if attendance_rate >= 0.9:
-                        risk_level = 'low'
-                    elif attendance_rate >= 0.7:
-                        risk_level = 'medium'
-                    else:
-                        risk_level = 'high'
-                
-                # Count recent absences (last 7 days)
-                recent_start = end_date - timedelta(days=7)
-                recent_attendance = [a for a in student_attendance 
-                                   if datetime.strptime(a['date'], '%Y-%m-%d') >= recent_start]
-                recent_absences = len([a for a in recent_attendance if a['status'] == 'absent'])
-                
-                prediction = {
-                    'student_id': student['id'],
-                    'student_name': f"{student['first_name']} {student['last_name']}",
-                    'risk_level': risk_level,
-                    'attendance_rate': round(attendance_rate * 100, 1),
-                    'recent_absences': recent_absences,
-                    'total_records': total_records,
-                    'recommendation': get_recommendation(risk_level, recent_absences)
-                }
-                
-                predictions.append(prediction)
-                
-            except Exception as e:
-                print(f"Error generating prediction for student {student['id']}: {e}")
-                # Continue with other students
-                continue
+                    risk_level = 'high'
+            
+            # Recent absences (last 7 days)
+            recent_absences = counts['recent_absent'] if counts else 0
+            
+            predictions.append({
+                'student_id': student['id'],
+                'student_name': f"{student['first_name']} {student['last_name']}",
+                'risk_level': risk_level,
+                'attendance_rate': round(attendance_rate * 100, 1),
+                'recent_absences': recent_absences,
+                'total_records': total_records,
+                'recommendation': RECOMMENDATIONS[risk_level]
+            })
         
         # Sort by risk level (high risk first)
         risk_order = {'high': 0, 'medium': 1, 'low': 2}
         predictions.sort(key=lambda x: risk_order.get(x['risk_level'], 3))
+        risk_counts = Counter(p['risk_level'] for p in predictions)
         
         return success_response(
             data={
@@ -691,9 +880,9 @@ def get_class_predictions(class_id):
                 'predictions': predictions,
                 'summary': {
                     'total_students': len(students),
-                    'high_risk': len([p for p in predictions if p['risk_level'] == 'high']),
-                    'medium_risk': len([p for p in predictions if p['risk_level'] == 'medium']),
-                    'low_risk': len([p for p in predictions if p['risk_level'] == 'low'])
+                    'high_risk': risk_counts['high'],
+                    'medium_risk': risk_counts['medium'],
+                    'low_risk': risk_counts['low']
                 }
             },
             message="Class predictions generated successfully"
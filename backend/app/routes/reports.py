@@ -6,8 +6,20 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt
 from datetime import datetime, timedelta
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import calendar
+import heapq
+from types import MappingProxyType
+
+# numpy is optional - status tallies fall back to plain Python counting
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from app.models import Attendance, Student, Class
+from app.utils.response_cache import cached_response, invalidate_cached_responses
+from app.utils.attendance_kernels import scan_absences, absence_flags, weekday_absences
 from app.utils.api_response import (
     success_response, error_response, validation_error_response,
     not_found_response, forbidden_response, server_error_response
@@ -15,9 +27,89 @@ from app.utils.api_response import (
 
 reports_bp = Blueprint('reports', __name__)
 
+REPORTS_CACHE_TTL = 120
+REPORTS_MAX_AGE = 60  # browser revalidation interval (seconds)
+
+# Shared pool for overlapping independent MongoDB round-trips (I/O releases the GIL)
+_query_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='reports-query')
+
+# Attendance statuses in tally column order
+STATUSES = ('present', 'absent', 'late', 'excused')
+STATUS_INDEX = MappingProxyType({status: i for i, status in enumerate(STATUSES)})
+NO_COUNTS = (0,) * len(STATUSES)
+
+# Daily report tallies also track students without a record
+DAILY_STATUSES = STATUSES + ('not_marked',)
+DAILY_STATUS_INDEX = MappingProxyType({status: i for i, status in enumerate(DAILY_STATUSES)})
+NOT_MARKED = DAILY_STATUS_INDEX['not_marked']
+
+
+def status_counts(row_index, status_index, rows):
+    """
+    Count (row, status) pairs into a rows x len(STATUSES) table
+    
+    Uses a single numpy bincount when available; returns nested lists of ints.
+    """
+    width = len(STATUSES)
+    if np is None:
+        counts = [[0] * width for _ in range(rows)]
+        for row, status in zip(row_index, status_index):
+            counts[row][status] += 1
+        return counts
+    
+    flat = np.asarray(row_index, dtype=np.int64) * width + np.asarray(status_index, dtype=np.int64)
+    return np.bincount(flat, minlength=rows * width).reshape(rows, width).tolist()
+
+
+# Reports are served from the shared store until attendance changes or the TTL passes
+cached_report = cached_response('reports', REPORTS_CACHE_TTL, max_age=REPORTS_MAX_AGE)
+
+
+def invalidate_report_cache():
+    """Retire all cached reports after attendance is written"""
+    invalidate_cached_responses('reports')
+
+
+# Student fields shown in report rows
+ROSTER_PROJECTION = {'first_name': 1, 'last_name': 1, 'student_id': 1, 'grade': 1}
+
+
+def load_class_rosters(student_model, classes):
+    """Fetch the students of all given classes in one query.
+    
+    Returns (rosters keyed by class id, students keyed by id).
+    """
+    student_ids = {sid for cls in classes for sid in cls.get('students', [])}
+    students_by_id = {
+        s['id']: s for s in student_model.find_by_ids(list(student_ids), ROSTER_PROJECTION)
+    }
+    
+    rosters = {
+        cls['id']: [students_by_id[sid] for sid in cls.get('students', []) if sid in students_by_id]
+        for cls in classes
+    }
+    return rosters, students_by_id
+
+
+def load_report_classes(class_model, student_model, class_id=None):
+    """The classes a report covers (one class, or all) and their rosters.
+    
+    Uses only the given models, so it can run on the query pool.
+    Returns (classes, rosters keyed by class id, students keyed by id).
+    """
+    if class_id:
+        cls = class_model.find_by_id(class_id)
+        classes = [cls] if cls else []
+    else:
+        classes = class_model.find_all()
+    
+    rosters, students_by_id = load_class_rosters(student_model, classes)
+    return classes, rosters, students_by_id
+
 
 @reports_bp.route('/daily', methods=['GET'])
 @jwt_required()
+@cached_report
 def daily_report():
     """Generate daily attendance report"""
     try:
@@ -40,8 +132,27 @@ def daily_report():
         if class_id:
             filters['class_id'] = class_id
         
-        # Get attendance records for the date
-        attendance_records = list(attendance_model.collection.find(filters))
+        # Attendance for the date, grouped per class by the database
+        pipeline = [
+            {'$match': filters},
+            {
+                '$group': {
+                    '_id': '$class_id',
+                    'records': {
+                        '$push': {
+                            'student_id': '$student_id',
+                            'status': '$status',
+                            'notes': '$notes',
+                            'marked_at': '$marked_at'
+                        }
+                    }
+                }
+            }
+        ]
+        attendance_by_class = {
+            group['_id']: {r['student_id']: r for r in group['records']}
+            for group in attendance_model.collection.aggregate(pipeline)
+        }
         
         # Get class information
         if class_id:
@@ -63,26 +174,17 @@ def daily_report():
             'classes': []
         }
         
-        overall_stats = defaultdict(int)
+        overall_stats = [0] * len(DAILY_STATUSES)
+        rosters, _ = load_class_rosters(student_model, classes)
         
         for cls in classes:
             # Get students in this class
-            class_students = student_model.find_by_class(cls['id'])
-            
-            # Get attendance for this class
-            class_attendance = [r for r in attendance_records if r.get('class_id') == cls['id']]
+            class_students = rosters[cls['id']]
             
-            # Create attendance map
-            attendance_map = {r['student_id']: r for r in class_attendance}
-            
-            class_summary = {
-                'present': 0,
-                'absent': 0,
-                'late': 0,
-                'excused': 0,
-                'not_marked': 0
-            }
+            # Attendance map for this class
+            attendance_map = attendance_by_class.get(cls['id'], {})
             
+            class_counts = [0] * len(DAILY_STATUSES)
             student_list = []
             
             for student in class_students:
@@ -90,12 +192,10 @@ def daily_report():
                 
                 if attendance_record:
                     status = attendance_record['status']
-                    class_summary[status] += 1
-                    overall_stats[status] += 1
+                    class_counts[DAILY_STATUS_INDEX[status]] += 1
                 else:
                     status = 'not_marked'
-                    class_summary['not_marked'] += 1
-                    overall_stats['not_marked'] += 1
+                    class_counts[NOT_MARKED] += 1
                 
                 student_list.append({
                     'id': student['id'],
@@ -109,6 +209,9 @@ def daily_report():
             # Sort students by name
             student_list.sort(key=lambda x: x['name'])
             
+            overall_stats = [total + count for total, count in zip(overall_stats, class_counts)]
+            class_summary = dict(zip(DAILY_STATUSES, class_counts))
+            
             class_data = {
                 'id': cls['id'],
                 'name': cls['name'],
@@ -124,7 +227,7 @@ def daily_report():
             report_data['summary']['total_students'] += len(class_students)
         
         # Update overall summary
-        report_data['summary'].update(dict(overall_stats))
+        report_data['summary'].update(zip(DAILY_STATUSES, overall_stats))
         
         if report_data['summary']['total_students'] > 0:
             total = report_data['summary']['total_students']
@@ -150,6 +253,7 @@ def daily_report():
 
 @reports_bp.route('/weekly', methods=['GET'])
 @jwt_required()
+@cached_report
 def weekly_report():
     """Generate weekly attendance report"""
     try:
@@ -186,20 +290,30 @@ def weekly_report():
         if class_id:
             date_filter['class_id'] = class_id
         
-        # Get all attendance records for the week
-        attendance_records = list(attendance_model.collection.find(date_filter))
+        # Classes and rosters load on the pool while the records are tallied
+        classes_future = _query_pool.submit(load_report_classes, class_model, student_model, class_id)
         
-        # Group by student and date
-        student_attendance = defaultdict(lambda: defaultdict(list))
+        # Stream the week's records, fetching only the fields that are counted
+        attendance_records = attendance_model.collection.find(
+            date_filter, {'date': 1, 'student_id': 1, 'status': 1, '_id': 0}
+        ).batch_size(1000)
+        
+        # Status counts per date and per student, tallied in one bincount each
+        week_dates = [(start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+        date_index = {date_str: i for i, date_str in enumerate(week_dates)}
+        student_index = {}
+        date_rows, student_rows, status_cols = [], [], []
         for record in attendance_records:
-            student_attendance[record['student_id']][record['date']].append(record)
+            status = STATUS_INDEX.get(record['status'])
+            date_row = date_index.get(record['date'])
+            if status is None or date_row is None:
+                continue
+            date_rows.append(date_row)
+            student_rows.append(student_index.setdefault(record['student_id'], len(student_index)))
+            status_cols.append(status)
         
-        # Get classes
-        if class_id:
-            classes = [class_model.find_by_id(class_id)]
-            classes = [cls for cls in classes if cls]
-        else:
-            classes = class_model.find_all()
+        by_date = status_counts(date_rows, status_cols, len(week_dates))
+        by_student = status_counts(student_rows, status_cols, len(student_index))
         
         report_data = {
             'week_start': week_start,
@@ -219,21 +333,17 @@ def weekly_report():
         current_date = start_date
         daily_stats = []
         
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            day_records = [r for r in attendance_records if r['date'] == date_str]
-            
+        for date_str, counts in zip(week_dates, by_date):
             day_stats = {
                 'date': date_str,
                 'day_name': current_date.strftime('%A'),
-                'present': len([r for r in day_records if r['status'] == 'present']),
-                'absent': len([r for r in day_records if r['status'] == 'absent']),
-                'late': len([r for r in day_records if r['status'] == 'late']),
-                'excused': len([r for r in day_records if r['status'] == 'excused'])
+                'present': counts[0],
+                'absent': counts[1],
+                'late': counts[2],
+                'excused': counts[3]
             }
             
-            day_stats['total'] = sum([day_stats['present'], day_stats['absent'], 
-                                    day_stats['late'], day_stats['excused']])
+            day_stats['total'] = sum(counts)
             
             if day_stats['total'] > 0:
                 day_stats['attendance_rate'] = round(day_stats['present'] / day_stats['total'] * 100, 1)
@@ -246,31 +356,21 @@ def weekly_report():
         report_data['daily_breakdown'] = daily_stats
         
         # Generate student summaries
-        all_students = set()
-        for cls in classes:
-            class_students = student_model.find_by_class(cls['id'])
-            all_students.update(student['id'] for student in class_students)
+        _, _, all_students = classes_future.result()
         
         student_summaries = []
         total_attendance_rates = []
-        
-        for student_id in all_students:
-            student = student_model.find_by_id(student_id)
-            if not student:
-                continue
-            
-            student_records = []
-            for date_str in [d['date'] for d in daily_stats]:
-                records = student_attendance[student_id].get(date_str, [])
-                if records:
-                    student_records.extend(records)
-            
-            # Calculate student statistics
-            present_count = len([r for r in student_records if r['status'] == 'present'])
-            absent_count = len([r for r in student_records if r['status'] == 'absent'])
-            late_count = len([r for r in student_records if r['status'] == 'late'])
-            excused_count = len([r for r in student_records if r['status'] == 'excused'])
-            total_records = len(student_records)
+        total_absences = 0
+        total_tardiness = 0
+        
+        for student_id, student in all_students.items():
+            # Calculate student statistics (records are already limited to the week)
+            row = student_index.get(student_id)
+            counts = by_student[row] if row is not None else NO_COUNTS
+            present_count, absent_count, late_count, excused_count = counts
+            total_records = sum(counts)
+            total_absences += absent_count
+            total_tardiness += late_count
             
             attendance_rate = (present_count / max(total_records, 1)) * 100
             total_attendance_rates.append(attendance_rate)
@@ -305,14 +405,14 @@ def weekly_report():
         report_data['summary']['days_analyzed'] = len([d for d in daily_stats if d['total'] > 0])
         
         if total_attendance_rates:
-            report_data['summary']['average_attendance_rate'] = round(
-                sum(total_attendance_rates) / len(total_attendance_rates), 1
-            )
+            if np is not None:
+                average_rate = float(np.mean(total_attendance_rates))
+            else:
+                average_rate = sum(total_attendance_rates) / len(total_attendance_rates)
+            report_data['summary']['average_attendance_rate'] = round(average_rate, 1)
         
-        report_data['summary']['total_absences'] = sum(s['statistics']['absent'] 
-                                                      for s in student_summaries)
-        report_data['summary']['total_tardiness'] = sum(s['statistics']['late'] 
-                                                       for s in student_summaries)
+        report_data['summary']['total_absences'] = total_absences
+        report_data['summary']['total_tardiness'] = total_tardiness
         
         return success_response(
             data={
@@ -329,6 +429,7 @@ def weekly_report():
 
 @reports_bp.route('/monthly', methods=['GET'])
 @jwt_required()
+@cached_report
 def monthly_report():
     """Generate monthly attendance report"""
     try:
@@ -359,42 +460,30 @@ def monthly_report():
         if class_id:
             date_filter['class_id'] = class_id
         
-        # Get attendance statistics using aggregation
+        # Get attendance statistics and the number of school days in one aggregation
         pipeline = [
             {'$match': date_filter},
             {
-                '$group': {
-                    '_id': {
-                        'student_id': '$student_id',
-                        'status': '$status'
-                    },
-                    'count': {'$sum': 1}
+                '$facet': {
+                    'by_student': [
+                        {
+                            '$group': {
+                                '_id': {
+                                    'student_id': '$student_id',
+                                    'status': '$status'
+                                },
+                                'count': {'$sum': 1}
+                            }
+                        }
+                    ],
+                    'school_days': [
+                        {'$group': {'_id': '$date'}},
+                        {'$count': 'days'}
+                    ]
                 }
             }
         ]
         
-        aggregated_data = list(attendance_model.collection.aggregate(pipeline))
-        
-        # Process aggregated data
-        student_stats = defaultdict(lambda: defaultdict(int))
-        for item in aggregated_data:
-            student_id = item['_id']['student_id']
-            status = item['_id']['status']
-            count = item['count']
-            student_stats[student_id][status] = count
-        
-        # Get classes and students
-        if class_id:
-            classes = [class_model.find_by_id(class_id)]
-            classes = [cls for cls in classes if cls]
-        else:
-            classes = class_model.find_all()
-        
-        all_students = set()
-        for cls in classes:
-            class_students = student_model.find_by_class(cls['id'])
-            all_students.update(student['id'] for student in class_students)
-        
         # Calculate trends (compare with previous month)
         prev_month_start = start_date - timedelta(days=32)  # Go back more than a month
         prev_month_start = prev_month_start.replace(day=1)  # First day of previous month
@@ -420,7 +509,26 @@ def monthly_report():
             }
         ]
         
-        prev_month_data = list(attendance_model.collection.aggregate(prev_pipeline))
+        # The three lookups are independent - overlap their round-trips
+        classes_future = _query_pool.submit(load_report_classes, class_model, student_model, class_id)
+        prev_future = _query_pool.submit(
+            lambda: list(attendance_model.collection.aggregate(prev_pipeline))
+        )
+        
+        facets = next(attendance_model.collection.aggregate(pipeline), {})
+        aggregated_data = facets.get('by_student', [])
+        school_days = facets['school_days'][0]['days'] if facets.get('school_days') else 0
+        
+        # Process aggregated data
+        student_stats = defaultdict(lambda: defaultdict(int))
+        for item in aggregated_data:
+            student_id = item['_id']['student_id']
+            status = item['_id']['status']
+            count = item['count']
+            student_stats[student_id][status] = count
+        
+        _, _, all_students = classes_future.result()
+        prev_month_data = prev_future.result()
         prev_month_stats = {item['_id']: item['count'] for item in prev_month_data}
         
         # Build report
@@ -432,7 +540,7 @@ def monthly_report():
                 'start_date': start_date.strftime('%Y-%m-%d'),
                 'end_date': end_date.strftime('%Y-%m-%d'),
                 'total_days': (end_date - start_date).days + 1,
-                'school_days': len(set(r['date'] for r in attendance_model.collection.find(date_filter)))
+                'school_days': school_days
             },
             'summary': {
                 'total_students': len(all_students),
@@ -475,11 +583,7 @@ def monthly_report():
         # Student performance analysis
         student_performance = []
         
-        for student_id in all_students:
-            student = student_model.find_by_id(student_id)
-            if not student:
-                continue
-            
+        for student_id, student in all_students.items():
             stats = student_stats[student_id]
             total_student_records = sum(stats.values())
             
@@ -503,14 +607,15 @@ def monthly_report():
                     }
                 })
         
-        # Sort for top performers and at-risk students
-        student_performance.sort(key=lambda x: x['statistics']['attendance_rate'], reverse=True)
+        # Top performers and at-risk students (only the at-risk subset is sorted)
+        by_rate = lambda x: x['statistics']['attendance_rate']
         
-        report_data['top_performers'] = student_performance[:10]  # Top 10
-        report_data['students_at_risk'] = [
-            s for s in student_performance 
-            if s['statistics']['attendance_rate'] < 85  # Below 85% attendance
-        ]
+        report_data['top_performers'] = heapq.nlargest(10, student_performance, key=by_rate)  # Top 10
+        report_data['students_at_risk'] = sorted(
+            (s for s in student_performance 
+             if s['statistics']['attendance_rate'] < 85),  # Below 85% attendance
+            key=by_rate, reverse=True
+        )
         
         return success_response(
             data={
@@ -527,6 +632,7 @@ def monthly_report():
 
 @reports_bp.route('/student/<student_id>', methods=['GET'])
 @jwt_required()
+@cached_report
 def student_report(student_id):
     """Generate individual student attendance report"""
     try:
@@ -544,23 +650,21 @@ def student_report(student_id):
         # Calculate date range
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days_back)
+        start_str = start_date.strftime('%Y-%m-%d')
+        end_str = end_date.strftime('%Y-%m-%d')
         
-        # Get attendance history
-        attendance_history = attendance_model.find_student_history(student_id, limit=100)
-        
-        # Filter by date range
-        filtered_history = [
-            record for record in attendance_history
-            if start_date.strftime('%Y-%m-%d') <= record['date'] <= end_date.strftime('%Y-%m-%d')
-        ]
+        # Attendance history for the period, oldest first
+        filtered_history = attendance_model.find_student_range(student_id, start_str, end_str)
         
         # Calculate statistics
         total_records = len(filtered_history)
         if total_records > 0:
-            present_count = len([r for r in filtered_history if r['status'] == 'present'])
-            absent_count = len([r for r in filtered_history if r['status'] == 'absent'])
-            late_count = len([r for r in filtered_history if r['status'] == 'late'])
-            excused_count = len([r for r in filtered_history if r['status'] == 'excused'])
+            counts = [0] * len(STATUSES)
+            for record in filtered_history:
+                status = STATUS_INDEX.get(record['status'])
+                if status is not None:
+                    counts[status] += 1
+            present_count, absent_count, late_count, excused_count = counts
             
             statistics = {
                 'total_days': total_records,
@@ -587,17 +691,9 @@ def student_report(student_id):
         # Identify patterns
         patterns = []
         
-        # Check for consecutive absences
-        sorted_history = sorted(filtered_history, key=lambda x: x['date'])
-        consecutive_absences = 0
-        max_consecutive = 0
-        
-        for record in sorted_history:
-            if record['status'] == 'absent':
-                consecutive_absences += 1
-                max_consecutive = max(max_consecutive, consecutive_absences)
-            else:
-                consecutive_absences = 0
+        # Check for consecutive absences (history is already in date order)
+        absent_flags = absence_flags(filtered_history)
+        max_consecutive, _, _ = scan_absences(absent_flags)
         
         if max_consecutive >= 3:
             patterns.append({
@@ -614,20 +710,26 @@ def student_report(student_id):
                 'severity': 'medium'
             })
         
-        # Check day-of-week patterns
-        day_stats = defaultdict(list)
+        # Check day-of-week patterns (weekdays for the period, computed once)
+        period_days = [start_date + timedelta(days=i) for i in range(days_back + 1)]
+        weekday_of = {day.strftime('%Y-%m-%d'): day.weekday() for day in period_days}
+        
+        weekday_codes = []
         for record in filtered_history:
-            date_obj = datetime.strptime(record['date'], '%Y-%m-%d')
-            day_name = date_obj.strftime('%A')
-            day_stats[day_name].append(record['status'])
+            weekday = weekday_of.get(record['date'])
+            if weekday is None:
+                weekday = datetime.strptime(record['date'], '%Y-%m-%d').weekday()
+            weekday_codes.append(weekday)
         
-        for day, statuses in day_stats.items():
-            if len(statuses) >= 3:  # Enough data
-                absent_rate = (statuses.count('absent') / len(statuses)) * 100
+        day_absent, day_totals = weekday_absences(absent_flags, weekday_codes)
+        
+        for weekday in range(7):
+            if day_totals[weekday] >= 3:  # Enough data
+                absent_rate = (day_absent[weekday] / day_totals[weekday]) * 100
                 if absent_rate > 40:  # More than 40% absences on this day
                     patterns.append({
                         'type': 'day_pattern',
-                        'description': f'High absence rate on {day}: {absent_rate:.1f}%',
+                        'description': f'High absence rate on {calendar.day_name[weekday]}: {absent_rate:.1f}%',
                         'severity': 'medium'
                     })
         
@@ -640,13 +742,13 @@ def student_report(student_id):
                 'class_id': student.get('class_id', '')
             },
             'period': {
-                'start_date': start_date.strftime('%Y-%m-%d'),
-                'end_date': end_date.strftime('%Y-%m-%d'),
+                'start_date': start_str,
+                'end_date': end_str,
                 'days_analyzed': days_back
             },
             'statistics': statistics,
             'patterns': patterns,
-            'recent_history': filtered_history[:20],  # Last 20 records
+            'recent_history': filtered_history[-20:][::-1],  # Last 20 records, newest first
             'recommendations': []
         }
         
@@ -687,6 +789,7 @@ def student_report(student_id):
 
 @reports_bp.route('/range', methods=['GET'])
 @jwt_required()
+@cached_report
 def range_report():
     """Generate attendance report for a date range"""
     try:
@@ -709,8 +812,6 @@ def range_report():
             return validation_error_response(["start_date must be before end_date"])
         
         attendance_model = Attendance(current_app.db)
-        student_model = Student(current_app.db)
-        class_model = Class(current_app.db)
         
         # Build filters for date range
         filters = {
@@ -722,18 +823,21 @@ def range_report():
         if class_id:
             filters['class_id'] = class_id
         
-        # Get attendance records
-        attendance_records = list(attendance_model.collection.find(filters))
-        
-        # Get all students and classes
-        students = student_model.find_all()
-        if class_id:
-            classes = [class_model.find_by_id(class_id)]
-            classes = [cls for cls in classes if cls]
-        else:
-            classes = class_model.find_all()
+        # Status counts per day, tallied by the database
+        pipeline = [
+            {'$match': filters},
+            {
+                '$group': {
+                    '_id': {'date': '$date', 'status': '$status'},
+                    'count': {'$sum': 1}
+                }
+            },
+            # Most recent first; days are kept in this order below
+            {'$sort': {'_id.date': -1}}
+        ]
+        date_status_groups = list(attendance_model.collection.aggregate(pipeline))
         
-        # Process data by date
+        # Process data by date (dicts keep first-seen order, so days stay sorted)
         daily_stats = defaultdict(lambda: {
             'date': '',
             'total_expected': 0,
@@ -745,14 +849,17 @@ def range_report():
         })
         
         # Calculate daily statistics
-        for record in attendance_records:
-            date = record['date'] if isinstance(record['date'], str) else record['date'].strftime('%Y-%m-%d')
+        for group in date_status_groups:
+            date = group['_id']['date']
+            if not isinstance(date, str):
+                date = date.strftime('%Y-%m-%d')
+            count = group['count']
             daily_stats[date]['date'] = date
-            daily_stats[date]['total_expected'] += 1
+            daily_stats[date]['total_expected'] += count
             
-            status = record.get('status', 'present')
+            status = group['_id'].get('status', 'present')
             if status in daily_stats[date]:
-                daily_stats[date][status] += 1
+                daily_stats[date][status] += count
         
         # Calculate attendance rates and format data for frontend
         daily_reports = []
@@ -773,9 +880,6 @@ def range_report():
                 'excused': date_data['excused']
             })
         
-        # Sort by date (most recent first)
-        daily_reports.sort(key=lambda x: x['date'], reverse=True)
-        
         return success_response(
             data=daily_reports,
             message="Range report generated successfully"
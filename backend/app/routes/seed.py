@@ -7,31 +7,65 @@ from flask import Blueprint, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt
 
 from app.utils.demo_data import initialize_demo_data
+from app.routes.reports import invalidate_report_cache
+from app.routes.students import invalidate_student_cache
+from app.routes.auth import invalidate_user_list_cache
 from app.utils.api_response import (
     success_response, error_response, forbidden_response, server_error_response
 )
 
 seed_bp = Blueprint('seed', __name__)
 
+# Marker document recording that this database has been seeded; it lives in
+# the database it describes, so wiping or switching databases clears it too
+SEEDED_MARKER = {'_id': 'seeded'}
+
+# Collections emptied by /seed/reset before reseeding
+RESET_COLLECTIONS = ['users', 'students', 'classes', 'attendance']
+
+
+def _already_seeded_response():
+    return success_response(
+        data={'message': 'Database already contains data - seeding skipped'},
+        message="Data already exists in database"
+    )
+
+
+def _is_seeded():
+    """Whether the seeded marker exists (a single _id lookup)"""
+    return current_app.db.meta.find_one(SEEDED_MARKER, {'_id': 1}) is not None
+
+
+def _mark_seeded():
+    current_app.db.meta.update_one(
+        SEEDED_MARKER, {'$currentDate': {'seeded_at': True}}, upsert=True
+    )
+
+
+def _clear_seeded():
+    current_app.db.meta.delete_one(SEEDED_MARKER)
+
 
 @seed_bp.route('', methods=['POST'])
 def seed_database():
     """Seed the database with demo data"""
     try:
-        # Check if data already exists
-        user_count = current_app.db.users.count_documents({})
+        if _is_seeded():
+            return _already_seeded_response()
         
-        if user_count > 0:
-            return success_response(
-                data={
-                    'users_existing': user_count,
-                    'message': 'Database already contains data - seeding skipped'
-                },
-                message="Data already exists in database"
-            )
+        # Check if data already exists (collection metadata, no scan)
+        if current_app.db.users.estimated_document_count() > 0:
+            _mark_seeded()
+            return _already_seeded_response()
         
         # Initialize demo data
-        result = initialize_demo_data(current_app.db)
+        result = initialize_demo_data(
+            current_app.db, rebuild_indexes=current_app.mongodb.create_indexes
+        )
+        _mark_seeded()
+        invalidate_report_cache()
+        invalidate_student_cache()
+        invalidate_user_list_cache()
         
         return success_response(
             data=result,
@@ -54,13 +88,18 @@ def reset_database():
         if user_role != 'admin':
             return forbidden_response('Admin access required')
         
-        # Clear all data and reinitialize (MongoDB collections)
-        current_app.db.users.delete_many({})
-        current_app.db.students.delete_many({})
-        current_app.db.classes.delete_many({})
-        current_app.db.attendance.delete_many({})
+        # Clear all data and reinitialize (MongoDB collections); until the
+        # reseed succeeds the database no longer counts as seeded
+        _clear_seeded()
+        current_app.mongodb.reset_collections(RESET_COLLECTIONS)
         
-        result = initialize_demo_data(current_app.db)
+        result = initialize_demo_data(
+            current_app.db, rebuild_indexes=current_app.mongodb.create_indexes
+        )
+        _mark_seeded()
+        invalidate_report_cache()
+        invalidate_student_cache()
+        invalidate_user_list_cache()
         
         return success_response(
             data=result,
@@ -2,12 +2,19 @@
 Student Management Routes for Intelligent Attendance Register
 """
 
+import hashlib
+import re
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 
 from app.models import Student
-from app.utils.validation import validate_student_data, sanitize_input, validate_pagination_params
+from app.utils.validation import (
+    validate_student_data, validate_student_rows, sanitize_input, validate_pagination_params
+)
+from app.utils.response_cache import cached_response, invalidate_cached_responses
+from app.routes.reports import invalidate_report_cache
 from app.utils.api_response import (
     success_response, error_response, validation_error_response,
     not_found_response, forbidden_response, server_error_response,
@@ -16,6 +23,54 @@ from app.utils.api_response import (
 
 students_bp = Blueprint('students', __name__)
 
+STUDENTS_CACHE_TTL = 300
+# Clients revalidate polled student data on every request; unchanged data gets a 304
+STUDENTS_MAX_AGE = 0
+
+# Normalization applied to student fields on write; other fields are stored as given
+STUDENT_FIELD_TRANSFORMS = {
+    'first_name': str.title,
+    'last_name': str.title,
+    'student_id': str.upper,
+    'grade': int,
+    'email': str.lower,
+    'parent_email': str.lower
+}
+
+# Fields of a student created through the API / through bulk import
+STUDENT_FIELDS = (
+    'first_name', 'last_name', 'student_id', 'grade', 'date_of_birth', 'email',
+    'phone', 'address', 'parent_email', 'parent_phone', 'emergency_contact',
+    'medical_info', 'notes', 'class_id'
+)
+BULK_STUDENT_FIELDS = (
+    'first_name', 'last_name', 'student_id', 'grade', 'date_of_birth', 'email',
+    'parent_email', 'class_id'
+)
+
+
+def normalize_student_field(field, value):
+    """Apply the field's normalization; empty values of normalized fields become ''"""
+    transform = STUDENT_FIELD_TRANSFORMS.get(field)
+    if transform is None:
+        return value
+    return transform(value) if value else ''
+
+
+def format_student(data, fields=STUDENT_FIELDS):
+    """Build a student document from sanitized, validated input"""
+    return {field: normalize_student_field(field, data.get(field, '')) for field in fields}
+
+
+def student_etag(student):
+    """Cheap validator for a student record: its id and last update time"""
+    return hashlib.md5(f"{student['id']}-{student.get('updated_at', '')}".encode()).hexdigest()
+
+
+def invalidate_student_cache():
+    """Retire cached class rosters after students or class membership change"""
+    invalidate_cached_responses('students')
+
 
 @students_bp.route('', methods=['GET'])
 @jwt_required()
@@ -28,6 +83,7 @@ def get_students():
         grade = request.args.get('grade')
         class_id = request.args.get('class_id')
         search = request.args.get('search', '').strip()
+        after_id = request.args.get('after_id')
         
         # Validate pagination
         page_num, per_page_num = validate_pagination_params(page, per_page)
@@ -43,31 +99,34 @@ def get_students():
         if class_id:
             filters['class_id'] = class_id
         
-        # Add search filter
+        # Add search filter: every word must prefix a name or the student ID
+        # (anchored regexes on the indexed search_terms array)
         if search:
-            search_regex = {'$regex': search, '$options': 'i'}
-            filters['$or'] = [
-                {'first_name': search_regex},
-                {'last_name': search_regex},
-                {'student_id': search_regex}
-            ]
-        
-        # Get students
+            filters['search_terms'] = {
+                '$all': [re.compile('^' + re.escape(word)) for word in search.lower().split()]
+            }
+        
+        # Get the requested page (paginated by the database)
         student_model = Student(current_app.db)
-        students = student_model.find_all(filters)
+        total = student_model.count(filters)
+        if after_id:
+            # Cursor paging: an index range scan, however deep the page
+            paginated_students = student_model.find_after(filters, after_id, per_page_num)
+        else:
+            paginated_students = student_model.find_page(
+                filters, (page_num - 1) * per_page_num, per_page_num
+            )
         
-        # Apply pagination
-        total = len(students)
-        start_idx = (page_num - 1) * per_page_num
-        end_idx = start_idx + per_page_num
-        paginated_students = students[start_idx:end_idx]
+        # Cursor for the following page, if this one was full
+        next_cursor = paginated_students[-1]['id'] if len(paginated_students) == per_page_num else None
         
         return paginated_response(
             data=paginated_students,
             page=page_num,
             per_page=per_page_num,
             total=total,
-            message="Students retrieved successfully"
+            message="Students retrieved successfully",
+            next_cursor=next_cursor
         )
         
     except Exception as e:
@@ -86,10 +145,20 @@ def get_student(student_id):
         if not student:
             return not_found_response("Student")
         
-        return success_response(
-            data=student,
-            message="Student retrieved successfully"
-        )
+        # Unchanged since the client's copy: skip serializing the body
+        etag = student_etag(student)
+        if etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            response, _ = success_response(
+                data=student,
+                message="Student retrieved successfully"
+            )
+        
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = STUDENTS_MAX_AGE
+        return response
         
     except Exception as e:
         print(f"❌ Error getting student {student_id}: {str(e)}")
@@ -118,32 +187,20 @@ def create_student():
         if errors:
             return validation_error_response(errors)
         
-        # Check for duplicate student ID
         student_model = Student(current_app.db)
-        existing_students = student_model.find_all({'student_id': data['student_id'].upper()})
-        if existing_students:
-            return error_response("Student ID already exists", 409)
         
         # Prepare student data
-        student_data = {
-            'first_name': data['first_name'].title(),
-            'last_name': data['last_name'].title(),
-            'student_id': data['student_id'].upper(),
-            'grade': int(data['grade']),
-            'date_of_birth': data['date_of_birth'],
-            'email': data.get('email', '').lower() if data.get('email') else '',
-            'phone': data.get('phone', ''),
-            'address': data.get('address', ''),
-            'parent_email': data.get('parent_email', '').lower() if data.get('parent_email') else '',
-            'parent_phone': data.get('parent_phone', ''),
-            'emergency_contact': data.get('emergency_contact', ''),
-            'medical_info': data.get('medical_info', ''),
-            'notes': data.get('notes', ''),
-            'class_id': data.get('class_id', '')
-        }
-        
-        # Create student
-        created_student = student_model.create(student_data)
+        student_data = format_student(data)
+        
+        # Create student (the unique indexes reject duplicate student IDs and emails)
+        try:
+            created_student = student_model.create(student_data)
+        except DuplicateKeyError as e:
+            if 'student_id' in str(e):
+                return error_response("Student ID already exists", 409)
+            return error_response("Student email already exists", 409)
+        invalidate_student_cache()
+        invalidate_report_cache()
         
         return success_response(
             data={'student': created_student},
@@ -190,11 +247,7 @@ def update_student(student_id):
         
         for field in updatable_fields:
             if field in data:
-                if field in ['first_name', 'last_name']:
-                    update_data[field] = data[field].title()
-                elif field in ['email', 'parent_email']:
-                    update_data[field] = data[field].lower() if data[field] else ''
-                elif field == 'grade':
+                if field == 'grade':
                     try:
                         update_data[field] = int(data[field])
                         if update_data[field] < 9 or update_data[field] > 12:
@@ -202,7 +255,7 @@ def update_student(student_id):
                     except ValueError:
                         return validation_error_response(["Invalid grade value"])
                 else:
-                    update_data[field] = data[field]
+                    update_data[field] = normalize_student_field(field, data[field])
         
         # Check for duplicate student ID if being changed
         if 'student_id' in data and data['student_id'].upper() != existing_student['student_id']:
@@ -216,6 +269,8 @@ def update_student(student_id):
         
         # Update student
         if student_model.update(student_id, update_data):
+            invalidate_student_cache()
+            invalidate_report_cache()
             updated_student = student_model.find_by_id(student_id)
             return success_response(
                 data={'student': updated_student},
@@ -247,6 +302,8 @@ def delete_student(student_id):
         
         # Soft delete (deactivate)
         if student_model.delete(student_id):
+            invalidate_student_cache()
+            invalidate_report_cache()
             return success_response(
                 data={},
                 message='Student deactivated successfully'
@@ -260,6 +317,7 @@ def delete_student(student_id):
 
 @students_bp.route('/class/<class_id>', methods=['GET'])
 @jwt_required()
+@cached_response('students', STUDENTS_CACHE_TTL, max_age=STUDENTS_MAX_AGE)
 def get_students_by_class(class_id):
     """Get all students in a specific class"""
     try:
@@ -294,46 +352,29 @@ def bulk_import_students():
             return validation_error_response(["Students data must be a list"])
         
         student_model = Student(current_app.db)
-        created_students = []
+        to_insert = []
+        insert_rows = []  # source row number of each document in to_insert
         errors = []
         
+        # Sanitize and validate the whole batch up front
+        students_data = sanitize_input(students_data)
+        invalid_rows = validate_student_rows(students_data)
+        
         for i, student_data in enumerate(students_data):
+            if i in invalid_rows:
+                errors.append({
+                    'row': i + 1,
+                    'errors': invalid_rows[i]
+                })
+                continue
+            
             try:
-                # Sanitize and validate
-                student_data = sanitize_input(student_data)
-                validation_errors = validate_student_data(student_data)
-                
-                if validation_errors:
-                    errors.append({
-                        'row': i + 1,
-                        'errors': validation_errors
-                    })
-                    continue
-                
-                # Check for duplicate student ID
-                existing = student_model.find_all({'student_id': student_data['student_id'].upper()})
-                if existing:
-                    errors.append({
-                        'row': i + 1,
-                        'errors': [f"Student ID {student_data['student_id']} already exists"]
-                    })
-                    continue
-                
                 # Prepare data
-                formatted_data = {
-                    'first_name': student_data['first_name'].title(),
-                    'last_name': student_data['last_name'].title(),
-                    'student_id': student_data['student_id'].upper(),
-                    'grade': int(student_data['grade']),
-                    'date_of_birth': student_data['date_of_birth'],
-                    'email': student_data.get('email', '').lower() if student_data.get('email') else '',
-                    'parent_email': student_data.get('parent_email', '').lower() if student_data.get('parent_email') else '',
-                    'class_id': student_data.get('class_id', '')
-                }
+                formatted_data = format_student(student_data, BULK_STUDENT_FIELDS)
                 
-                # Create student
-                created_student = student_model.create(formatted_data)
-                created_students.append(created_student)
+                # Queue for the batched insert
+                to_insert.append(formatted_data)
+                insert_rows.append(i + 1)
                 
             except Exception as e:
                 errors.append({
@@ -341,6 +382,22 @@ def bulk_import_students():
                     'errors': [str(e)]
                 })
         
+        # Create all valid students in one write; the unique indexes reject
+        # duplicates, whether already stored or repeated within this batch
+        created_students, failed = student_model.create_many(to_insert)
+        for index, write_error in failed.items():
+            message = write_error.get('errmsg', 'Write failed')
+            if write_error.get('code') == 11000 and 'student_id' in message:
+                message = f"Student ID {to_insert[index]['student_id']} already exists"
+            errors.append({
+                'row': insert_rows[index],
+                'errors': [message]
+            })
+        errors.sort(key=lambda error: error['row'])
+        if created_students:
+            invalidate_student_cache()
+            invalidate_report_cache()
+        
         status_code = 200 if not errors else 207  # 207 = Multi-Status
         return success_response(
             data={
@@ -4,34 +4,42 @@ Handles user management endpoints
 """
 
 from flask import Blueprint, request, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
+from pymongo import ReturnDocument
 
 from app.models import User
+from app.routes.auth import (
+    invalidate_cached_claims, invalidate_teacher_cache, invalidate_user_list_cache
+)
+from app.utils.error_handlers import require_role
+from app.utils.response_cache import cached_response
 from app.utils.api_response import (
-    success_response, error_response, forbidden_response, server_error_response
+    success_response, error_response, server_error_response
 )
 
 users_bp = Blueprint('users', __name__)
 
+USERS_CACHE_TTL = 300
+
+# Fields returned by the user listing; the id is stringified server-side
+USER_LIST_PROJECTION = {
+    '_id': 0,
+    'id': {'$toString': '$_id'},
+    'first_name': 1,
+    'last_name': 1,
+    'email': 1,
+    'role': 1,
+    'status': 1,
+    'phone': 1
+}
+
 @users_bp.route('/', methods=['GET'])
 @jwt_required()
+@require_role('admin', message="Access denied")
+@cached_response('users', USERS_CACHE_TTL)
 def get_users():
     """Get users by role (admin only)"""
     try:
-        # Get current user's role from JWT
-        current_user = get_jwt_identity()
-        if isinstance(current_user, dict):
-            current_role = current_user.get('role')
-        else:
-            # If identity is just a string, we need to look up the user
-            user_model = User(current_app.db)
-            user_data = user_model.find_by_id(current_user)
-            current_role = user_data.get('role') if user_data else None
-        
-        # Only admins can access this endpoint
-        if current_role != 'admin':
-            return forbidden_response("Access denied")
-        
         # Get query parameters
         role_filter = request.args.get('role')
         
@@ -40,17 +48,14 @@ def get_users():
         if role_filter:
             query['role'] = role_filter
         
-        # Get users
-        users = list(current_app.db.users.find(query, {
-            'password': 0  # Exclude password hash from response
-        }))
-        
-        # Convert ObjectId to string for JSON serialization
-        for user in users:
-            if '_id' in user:
-                user['id'] = str(user['_id'])
-                del user['_id']
+        # Get users, shaped for the listing by the database (no password hash)
+        users = list(current_app.db.users.aggregate([
+            {'$match': query},
+            {'$project': USER_LIST_PROJECTION}
+        ]))
         
+        # The encoded body is kept in the users response cache, so only
+        # cache misses read the collection
         return success_response(
             data={
                 'users': users,
@@ -65,23 +70,10 @@ def get_users():
 
 @users_bp.route('/<user_id>', methods=['GET'])
 @jwt_required()
+@require_role('admin', message="Access denied")
 def get_user_by_id(user_id):
     """Get a specific user by ID (admin only)"""
     try:
-        # Get current user's role from JWT
-        current_user = get_jwt_identity()
-        if isinstance(current_user, dict):
-            current_role = current_user.get('role')
-        else:
-            # If identity is just a string, we need to look up the user
-            user_model = User(current_app.db)
-            user_data = user_model.find_by_id(current_user)
-            current_role = user_data.get('role') if user_data else None
-        
-        # Only admins can access this endpoint
-        if current_role != 'admin':
-            return forbidden_response("Access denied")
-        
         # Get user by ID
         user_model = User(current_app.db)
         user = user_model.find_by_id(user_id)
@@ -104,35 +96,16 @@ def get_user_by_id(user_id):
 
 @users_bp.route('/<user_id>', methods=['PUT'])
 @jwt_required()
+@require_role('admin', message="Access denied")
 def update_user(user_id):
     """Update a user (admin only)"""
     try:
-        # Get current user's role from JWT
-        current_user = get_jwt_identity()
-        if isinstance(current_user, dict):
-            current_role = current_user.get('role')
-        else:
-            # If identity is just a string, we need to look up the user
-            user_model = User(current_app.db)
-            user_data = user_model.find_by_id(current_user)
-            current_role = user_data.get('role') if user_data else None
-        
-        # Only admins can access this endpoint
-        if current_role != 'admin':
-            return forbidden_response("Access denied")
-        
         data = request.get_json()
         if not data:
             return error_response("No data provided")
         
-        # Get user by ID
         user_model = User(current_app.db)
-        user = user_model.find_by_id(user_id)
-        
-        if not user:
-            return error_response("User not found", 404)
         
-        # Update user
         update_data = {}
         allowed_fields = ['first_name', 'last_name', 'email', 'role', 'phone', 'status']
         
@@ -140,13 +113,30 @@ def update_user(user_id):
             if field in data:
                 update_data[field] = data[field]
         
-        if update_data:
-            current_app.db.users.update_one(
-                {'_id': user['_id']},
-                {'$set': update_data}
+        if not update_data:
+            if not user_model.find_by_id(user_id, {'_id': 1}):
+                return error_response("User not found", 404)
+            return success_response(
+                message='User updated successfully'
             )
         
+        # Update and read back in one round-trip, without the password hash
+        user = user_model.collection.find_one_and_update(
+            {'_id': user_model.to_object_id(user_id)},
+            {'$set': update_data},
+            projection={'password': 0},
+            return_document=ReturnDocument.AFTER
+        )
+        
+        if not user:
+            return error_response("User not found", 404)
+        
+        invalidate_cached_claims(user_id)
+        invalidate_teacher_cache()
+        invalidate_user_list_cache()
+        
         return success_response(
+            data={'user': user_model.to_dict(user)},
             message='User updated successfully'
         )
         
@@ -156,32 +146,23 @@ def update_user(user_id):
 
 @users_bp.route('/<user_id>', methods=['DELETE'])
 @jwt_required()
+@require_role('admin', message="Access denied")
 def delete_user(user_id):
     """Delete a user (admin only)"""
     try:
-        # Get current user's role from JWT
-        current_user = get_jwt_identity()
-        if isinstance(current_user, dict):
-            current_role = current_user.get('role')
-        else:
-            # If identity is just a string, we need to look up the user
-            user_model = User(current_app.db)
-            user_data = user_model.find_by_id(current_user)
-            current_role = user_data.get('role') if user_data else None
-        
-        # Only admins can access this endpoint
-        if current_role != 'admin':
-            return forbidden_response("Access denied")
-        
-        # Get user by ID
+        # Look up and delete in one round-trip
         user_model = User(current_app.db)
-        user = user_model.find_by_id(user_id)
+        user = user_model.collection.find_one_and_delete(
+            {'_id': user_model.to_object_id(user_id)},
+            projection={'_id': 1}
+        )
         
         if not user:
             return error_response("User not found", 404)
         
-        # Delete user
-        current_app.db.users.delete_one({'_id': user['_id']})
+        invalidate_cached_claims(user_id)
+        invalidate_teacher_cache()
+        invalidate_user_list_cache()
         
         return success_response(
             message='User deleted successfully'
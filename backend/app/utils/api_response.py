@@ -3,6 +3,7 @@ Standardized API Response Utilities
 Ensures all APIs return consistent response formats
 """
 
+from dataclasses import dataclass
 from flask import jsonify
 from typing import Any, Dict, Optional, List
 
@@ -70,12 +71,25 @@ def error_response(
     return jsonify(response), status_code
 
 
+@dataclass(slots=True)
+class PageMeta:
+    """Pagination metadata; serialized natively by the JSON provider"""
+    page: int
+    per_page: int
+    total: int
+    total_pages: int
+    has_next: bool
+    has_prev: bool
+    next_cursor: Optional[str] = None
+
+
 def paginated_response(
     data: List,
     page: int,
     per_page: int,
     total: int,
-    message: str = "Data retrieved successfully"
+    message: str = "Data retrieved successfully",
+    next_cursor: Optional[str] = None
 ) -> tuple:
     """
     Create a paginated response
@@ -86,21 +100,23 @@ def paginated_response(
         per_page: Items per page
         total: Total number of items
         message: Success message
+        next_cursor: Opaque cursor for the next page, for cursor-based paging
     
     Returns:
         tuple: (response, status_code)
     """
-    total_pages = (total + per_page - 1) // per_page
+    total_pages = -(-total // per_page)
     
     meta = {
-        "pagination": {
-            "page": page,
-            "per_page": per_page,
-            "total": total,
-            "total_pages": total_pages,
-            "has_next": page < total_pages,
-            "has_prev": page > 1
-        }
+        "pagination": PageMeta(
+            page=page,
+            per_page=per_page,
+            total=total,
+            total_pages=total_pages,
+            has_next=page < total_pages,
+            has_prev=page > 1,
+            next_cursor=next_cursor
+        )
     }
     
     return success_response(
@@ -0,0 +1,93 @@
+"""
+Compiled scans over per-student attendance sequences
+Numba JIT-compiles the kernels when installed; otherwise they run as plain Python
+"""
+
+# Numba is optional - fall back to the uncompiled functions if not available
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# numpy arrays feed the compiled kernel; plain lists are faster for the Python fallback
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@njit(cache=True)
+def scan_absences(absent_flags):
+    """
+    Single pass over date-ordered absence flags (1 = absent, 0 = other)
+    
+    Returns:
+        tuple: (max consecutive absences, first-half absences, second-half absences)
+    """
+    n = len(absent_flags)
+    mid = n // 2
+    current = 0
+    longest = 0
+    first_half = 0
+    second_half = 0
+    
+    for i in range(n):
+        if absent_flags[i]:
+            current += 1
+            if current > longest:
+                longest = current
+            if i < mid:
+                first_half += 1
+            else:
+                second_half += 1
+        else:
+            current = 0
+    
+    return longest, first_half, second_half
+
+
+@njit(cache=True)
+def count_weekday_absences(absent_flags, weekday_codes, day_absent, day_totals):
+    """Accumulate absences and record totals per weekday (Monday = 0) in place"""
+    for i in range(len(absent_flags)):
+        day = weekday_codes[i]
+        day_totals[day] += 1
+        if absent_flags[i]:
+            day_absent[day] += 1
+
+
+def weekday_absences(absent_flags, weekday_codes):
+    """
+    Absences and record totals per weekday for parallel flag/weekday sequences
+    
+    Returns:
+        tuple: (absences per weekday, records per weekday), each of length 7
+    """
+    if NUMBA_AVAILABLE and np is not None:
+        weekday_codes = np.asarray(weekday_codes, dtype=np.int8)
+        day_absent = np.zeros(7, dtype=np.int64)
+        day_totals = np.zeros(7, dtype=np.int64)
+    else:
+        day_absent = [0] * 7
+        day_totals = [0] * 7
+    
+    count_weekday_absences(absent_flags, weekday_codes, day_absent, day_totals)
+    return day_absent, day_totals
+
+
+def absence_flags(records):
+    """Absence flags for date-ordered records, in the form scan_absences runs fastest on"""
+    if NUMBA_AVAILABLE and np is not None:
+        return np.fromiter(
+            (1 if r.get('status') == 'absent' else 0 for r in records),
+            dtype=np.int8,
+            count=len(records)
+        )
+    return [1 if r.get('status') == 'absent' else 0 for r in records]
@@ -1,27 +1,136 @@
 """
 Demo data initialization for development and testing
 """
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from werkzeug.security import generate_password_hash
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 import random
 from bson import ObjectId
+from pymongo import InsertOne
+from pymongo.errors import InvalidOperation, OperationFailure
 
-def initialize_demo_data(db):
-    """Initialize demo data for development/testing with MongoDB"""
+# NumPy is optional - demo statuses are drawn with the random module if not available
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from app.models import student_search_terms
+
+# Demo credentials are public and are upgraded to argon2id on first login,
+# so a low PBKDF2 cost is enough; each one is hashed once per process
+DEMO_PASSWORD_METHOD = 'pbkdf2:sha256:1000'
+DEMO_PASSWORDS = {'admin': 'admin123', 'teacher': 'teacher123', 'parent': 'parent123'}
+
+# Collections cleared and repopulated by initialize_demo_data
+DEMO_COLLECTIONS = ('users', 'students', 'classes', 'attendance', 'alerts', 'predictions', 'reports')
+
+
+@lru_cache(maxsize=None)
+def demo_password_hash(password):
+    """Cheap, cached hash of a demo account password"""
+    return generate_password_hash(password, method=DEMO_PASSWORD_METHOD, salt_length=8)
+
+
+# Overall statuses drawn for demo attendance: 85% present, otherwise an even
+# split of the rest; generally present students miss a given class 5% of the time
+DEMO_STATUSES = ('present', 'absent', 'late', 'excused')
+DEMO_PRESENT_RATE = 0.85
+DEMO_CLASS_PRESENT_RATE = 0.95
+DEMO_MARKED_TIME = time(hour=9)
+
+
+def _demo_status_draws(n_days, n_students, n_classes):
+    """Draw every demo status at once: overall status indices per day/student,
+    and per-class presence flags per day/student/class (as nested lists)"""
+    if np is not None:
+        rng = np.random.default_rng()
+        overall = np.where(
+            rng.random((n_days, n_students)) < DEMO_PRESENT_RATE,
+            0,
+            rng.integers(1, len(DEMO_STATUSES), (n_days, n_students))
+        )
+        in_class = rng.random((n_days, n_students, n_classes)) < DEMO_CLASS_PRESENT_RATE
+        return overall.tolist(), in_class.tolist()
+    
+    overall = [
+        [0 if random.random() < DEMO_PRESENT_RATE else random.randrange(1, len(DEMO_STATUSES))
+         for _ in range(n_students)]
+        for _ in range(n_days)
+    ]
+    in_class = [
+        [[random.random() < DEMO_CLASS_PRESENT_RATE for _ in range(n_classes)]
+         for _ in range(n_students)]
+        for _ in range(n_days)
+    ]
+    return overall, in_class
+
+
+def _insert_demo_documents(db, demo_documents):
+    """Insert the demo documents, one {collection name: documents} batch each
+    
+    Every _id is pre-generated or server-assigned and nothing depends on
+    insertion order, so all writes are unordered. On MongoDB 8.0+ (with
+    PyMongo 4.9+) they go out as a single cross-collection bulkWrite command;
+    older servers get one insert_many per collection.
+    """
+    if hasattr(db.client, 'bulk_write'):
+        operations = [
+            InsertOne(document, namespace=f"{db.name}.{collection_name}")
+            for collection_name, documents in demo_documents.items()
+            for document in documents
+        ]
+        try:
+            db.client.bulk_write(operations, ordered=False)
+            return
+        except InvalidOperation:
+            # Server predates the bulkWrite command; nothing was sent
+            pass
+    
+    for collection_name, documents in demo_documents.items():
+        db[collection_name].insert_many(documents, ordered=False)
+
+
+def _drop_deferrable_indexes(collection):
+    """Drop an empty collection's non-unique secondary indexes before a bulk insert
+    
+    Collections that still hold documents are left alone, and unique
+    indexes (and _id) are always kept so they keep rejecting duplicates.
+    """
+    try:
+        if collection.count_documents({}, limit=1):
+            return
+        for name, info in collection.index_information().items():
+            if name != '_id_' and not info.get('unique'):
+                collection.drop_index(name)
+    except OperationFailure:
+        # Collection does not exist yet - nothing to drop
+        pass
+
+
+def initialize_demo_data(db, rebuild_indexes=None):
+    """Initialize demo data for development/testing with MongoDB
+    
+    If rebuild_indexes is given, the non-unique secondary indexes of the
+    (now empty) collections are dropped before the insert and rebuilt
+    afterwards by calling it - one sorted build per index instead of an
+    index update per document. Unique indexes stay in place throughout, and
+    the rebuild runs even if the insert fails.
+    """
     
     # Clear existing data in MongoDB collections
     try:
-        db.users.delete_many({})
-        db.students.delete_many({})
-        db.classes.delete_many({})
-        db.attendance.delete_many({})
-        db.alerts.delete_many({})
-        db.predictions.delete_many({})
-        db.reports.delete_many({})
+        for collection_name in DEMO_COLLECTIONS:
+            db[collection_name].delete_many({})
         print("🗑️  Cleared existing data")
     except Exception as e:
         print(f"⚠️  Warning: Could not clear data: {e}")
     
+    if rebuild_indexes:
+        for collection_name in DEMO_COLLECTIONS:
+            _drop_deferrable_indexes(db[collection_name])
+    
     # Pre-generate ObjectIds for consistent references
     admin_id = ObjectId()
     teacher_id = ObjectId()
@@ -32,12 +141,18 @@ def initialize_demo_data(db):
     class_1_id = ObjectId()
     class_2_id = ObjectId()
     
+    # Hash the demo passwords concurrently (PBKDF2 releases the GIL)
+    with ThreadPoolExecutor(max_workers=len(DEMO_PASSWORDS)) as executor:
+        password_hashes = dict(zip(
+            DEMO_PASSWORDS, executor.map(demo_password_hash, DEMO_PASSWORDS.values())
+        ))
+    
     # Demo users (using ObjectIds)
     demo_users = [
         {
             '_id': admin_id,
             'email': 'admin@alexander.academy',
-            'password': generate_password_hash('admin123', method='pbkdf2:sha256'),
+            'password': password_hashes['admin'],
             'first_name': 'Admin',
             'last_name': 'User',
             'role': 'admin',
@@ -46,7 +161,7 @@ def initialize_demo_data(db):
         {
             '_id': teacher_id,
             'email': 'teacher@alexander.academy',
-            'password': generate_password_hash('teacher123', method='pbkdf2:sha256'),
+            'password': password_hashes['teacher'],
             'first_name': 'Sarah',
             'last_name': 'Johnson',
             'role': 'teacher',
@@ -56,7 +171,7 @@ def initialize_demo_data(db):
         {
             '_id': parent_id,
             'email': 'parent@alexander.academy',
-            'password': generate_password_hash('parent123', method='pbkdf2:sha256'),
+            'password': password_hashes['parent'],
             'first_name': 'Michael',
             'last_name': 'Smith',
             'role': 'parent',
@@ -138,52 +253,54 @@ def initialize_demo_data(db):
         }
     ]
     
-    # Generate demo attendance records for the last 30 days
-    demo_attendance = []
+    # Generate demo attendance records for the last 30 days (weekdays only)
     today = datetime.now().date()
+    dates = [
+        date for date in (today - timedelta(days=i) for i in range(30))
+        if date.weekday() < 5
+    ]
+    n_classes = max(len(student['classes']) for student in demo_students)
+    overall_draws, class_draws = _demo_status_draws(len(dates), len(demo_students), n_classes)
     
-    for i in range(30):
-        date = today - timedelta(days=i)
-        # Skip weekends
-        if date.weekday() >= 5:
-            continue
-            
-        for student in demo_students:
-            # Create one attendance record per student per day (not per class)
-            # 85% attendance rate (realistic for demo)
-            overall_status = 'present' if random.random() < 0.85 else random.choice(['absent', 'late', 'excused'])
+    demo_attendance = []
+    for date, day_overall, day_classes in zip(dates, overall_draws, class_draws):
+        marked_at = datetime.combine(date, DEMO_MARKED_TIME)
+        date_str = date.isoformat()
+        
+        for student, status_index, in_class in zip(demo_students, day_overall, day_classes):
+            # One attendance record per student per day (not per class)
+            overall_status = DEMO_STATUSES[status_index]
             
-            # Create class-specific attendance within the same record
+            # Class-specific attendance within the same record
             class_attendance = {}
-            for class_id in student['classes']:
-                # If student is absent for the day, they're absent from all classes
+            for position, class_id in enumerate(student['classes']):
                 if overall_status == 'absent':
+                    # Absent for the day means absent from all classes
                     class_status = 'absent'
                 elif overall_status == 'late':
-                    # If late, might be late to first class but present to others
-                    class_status = 'late' if class_id == student['classes'][0] else 'present'
+                    # Late to the first class, present for the others
+                    class_status = 'late' if position == 0 else 'present'
                 else:
-                    # Small chance of being absent from individual classes even if generally present
-                    class_status = 'present' if random.random() < 0.95 else 'absent'
+                    # Small chance of missing an individual class
+                    class_status = 'present' if in_class[position] else 'absent'
                 
                 # Convert ObjectId to string for dictionary key
                 class_attendance[str(class_id)] = {
                     'status': class_status,
-                    'marked_at': datetime.combine(date, datetime.min.time().replace(hour=9)),
+                    'marked_at': marked_at,
                     'marked_by': teacher_id  # ObjectId reference
                 }
             
-            attendance_record = {
+            demo_attendance.append({
                 # Let MongoDB generate ObjectId for attendance records
                 'student_id': student['_id'],  # ObjectId reference
-                'date': date.isoformat(),
+                'date': date_str,
                 'overall_status': overall_status,
                 'class_attendance': class_attendance,
                 'marked_by': teacher_id,  # ObjectId reference
-                'marked_at': datetime.combine(date, datetime.min.time().replace(hour=9)),
+                'marked_at': marked_at,
                 'notes': 'Demo data' if overall_status != 'present' else ''
-            }
-            demo_attendance.append(attendance_record)
+            })
 
     # Generate demo alerts
     demo_alerts = [
@@ -383,13 +500,23 @@ def initialize_demo_data(db):
     
     # Insert data into MongoDB collections
     try:
-        db.users.insert_many(demo_users)
-        db.classes.insert_many(demo_classes)
-        db.students.insert_many(demo_students)
-        db.attendance.insert_many(demo_attendance)
-        db.alerts.insert_many(demo_alerts)
-        db.predictions.insert_many(demo_predictions)
-        db.reports.insert_many(demo_reports)
+        for student in demo_students:
+            student['search_terms'] = student_search_terms(student)
+        
+        demo_documents = {
+            'users': demo_users,
+            'classes': demo_classes,
+            'students': demo_students,
+            'attendance': demo_attendance,
+            'alerts': demo_alerts,
+            'predictions': demo_predictions,
+            'reports': demo_reports
+        }
+        try:
+            _insert_demo_documents(db, demo_documents)
+        finally:
+            if rebuild_indexes:
+                rebuild_indexes()
         
         print(f"📊 MongoDB demo data created:")
         print(f"   - {len(demo_users)} users")
@@ -4,9 +4,10 @@ Provides consistent error handling across the application
 """
 
 from flask import jsonify, request
+from flask_jwt_extended import get_jwt
 from werkzeug.exceptions import HTTPException
 import traceback
-from app.utils.api_response import error_response, server_error_response
+from app.utils.api_response import error_response, server_error_response, forbidden_response
 
 
 def register_error_handlers(app):
@@ -144,4 +145,22 @@ def require_json(f):
                 error_code="MISSING_JSON"
             )
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+
+def require_role(*roles, message="Insufficient permissions"):
+    """Decorator rejecting users whose JWT role is not in roles.
+    
+    Runs before the view body, so the request JSON is never parsed for
+    unauthorized callers. Apply below @jwt_required().
+    """
+    from functools import wraps
+    
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if get_jwt().get('role') not in roles:
+                return forbidden_response(message)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
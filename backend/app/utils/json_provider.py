@@ -0,0 +1,34 @@
+"""
+orjson-backed JSON provider for Flask
+Used for request parsing and every jsonify() response when orjson is installed
+"""
+
+from flask.json.provider import JSONProvider
+
+# Fast JSON encoder - Flask's default provider is used if not available
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+    ORJSON_OPTIONS = 0
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider using orjson; ObjectIds and other unknown types are stringified"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=str, option=ORJSON_OPTIONS),
+            mimetype='application/json'
+        )
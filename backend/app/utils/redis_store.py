@@ -0,0 +1,116 @@
+"""
+Redis connection for shared, short-lived state (token revocation, caches)
+Falls back to an in-process store when Redis is not configured
+"""
+
+import os
+import time
+import threading
+
+# Redis is optional - use the in-process store if not available
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    redis = None
+
+
+class InMemoryStore:
+    """Minimal in-process stand-in for the Redis commands used by the app.
+
+    Only suitable for a single worker: state is not shared across processes.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+            return True
+        return False
+
+    def get(self, key):
+        with self._lock:
+            if self._expired(key):
+                return None
+            return self._data.get(key)
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = value
+            if ex is not None:
+                self._expires[key] = time.monotonic() + ex
+            else:
+                self._expires.pop(key, None)
+        return True
+
+    def setex(self, key, time_seconds, value):
+        return self.set(key, value, ex=time_seconds)
+
+    def exists(self, key):
+        with self._lock:
+            return 0 if self._expired(key) or key not in self._data else 1
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self._expired(key)  # drops the key if its TTL has passed
+            value = int(self._data.get(key, 0)) + amount
+            self._data[key] = value
+        return value
+
+    def expire(self, key, time_seconds):
+        with self._lock:
+            if self._expired(key) or key not in self._data:
+                return False
+            self._expires[key] = time.monotonic() + time_seconds
+        return True
+
+    def hget(self, name, key):
+        with self._lock:
+            if self._expired(name):
+                return None
+            return self._data.get(name, {}).get(key)
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        with self._lock:
+            if self._expired(name) or name not in self._data:
+                self._data[name] = {}
+            added = sum(1 for k in items if k not in self._data[name])
+            self._data[name].update(items)
+        return added
+
+    def delete(self, *keys):
+        removed = 0
+        with self._lock:
+            for key in keys:
+                self._expires.pop(key, None)
+                if self._data.pop(key, None) is not None:
+                    removed += 1
+        return removed
+
+
+def create_redis_client():
+    """Create a pooled Redis client from REDIS_URL, or an in-process store"""
+    redis_url = os.getenv('REDIS_URL')
+
+    if not REDIS_AVAILABLE or not redis_url:
+        print("ℹ️ Redis not configured, using in-process store")
+        return InMemoryStore()
+
+    try:
+        pool = redis.ConnectionPool.from_url(redis_url, decode_responses=True)
+        client = redis.Redis(connection_pool=pool)
+        client.ping()
+        return client
+    except Exception as e:
+        print(f"⚠️ Could not connect to Redis, using in-process store: {e}")
+        return InMemoryStore()
@@ -0,0 +1,62 @@
+"""
+Shared-store cache for read-heavy JSON endpoints
+Entries are versioned per namespace, so a write retires them all with one counter bump
+"""
+
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, request
+
+
+def _version_key(namespace):
+    return f"{namespace}:version"
+
+
+def cached_response(namespace, ttl, max_age=None):
+    """
+    Cache successful JSON responses of a view in the shared store (app.redis)
+
+    Entries are keyed by path and sorted query string under the namespace's
+    current version. Responses must not depend on who is asking beyond what
+    the decorators applied before this one already enforce.
+
+    Args:
+        namespace: Cache namespace, invalidated with invalidate_cached_responses
+        ttl: Seconds an entry stays in the store
+        max_age: If set, responses get Cache-Control/ETag headers and
+            matching If-None-Match requests get a 304
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            store = current_app.redis
+            version = store.get(_version_key(namespace)) or 0
+            query = urlencode(sorted(request.args.items(multi=True)))
+            key = f"{namespace}:{version}:{request.path}?{query}"
+
+            cached = store.get(key)
+            if cached is not None:
+                response = current_app.response_class(cached, mimetype='application/json')
+            else:
+                response, status_code = view(*args, **kwargs)
+                # Streamed bodies are never buffered into the store
+                if status_code != 200 or response.is_streamed:
+                    return response, status_code
+                # Store the encoded body as-is; no decode/re-encode on either path
+                store.setex(key, ttl, response.get_data())
+
+            if max_age is None:
+                return response
+
+            response.cache_control.private = True
+            response.cache_control.max_age = max_age
+            response.add_etag()
+            return response.make_conditional(request)
+
+        return wrapper
+    return decorator
+
+
+def invalidate_cached_responses(namespace):
+    """Retire every cached response in a namespace"""
+    current_app.redis.incr(_version_key(namespace))
@@ -6,14 +6,30 @@ import re
 from typing import Any, Dict, List
 from datetime import datetime
 
+# Patterns used on the auth path, compiled once at import
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+LETTER_RE = re.compile(r'[a-zA-Z]')
+DIGIT_RE = re.compile(r'\d')
+
+# Record validation patterns (student/class imports run these per row)
+STUDENT_ID_RE = re.compile(r'^[A-Z0-9]{6,10}$')
+CLASS_CODE_RE = re.compile(r'^[A-Z]{2,4}\d{3,4}$')
+OBJECT_ID_RE = re.compile(r'^[a-f0-9]{24}$', re.IGNORECASE)
+UUID_RE = re.compile(r'^[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}$', re.IGNORECASE)
+
+STUDENT_REQUIRED_FIELDS = ('first_name', 'last_name', 'student_id', 'grade', 'date_of_birth')
+VALID_STATUSES = ('present', 'absent', 'late', 'excused')
+
+# Characters stripped by sanitize_input, as a str.translate deletion table
+SANITIZE_TABLE = str.maketrans('', '', '<>"\';')
+
 
 def validate_email(email: str) -> bool:
     """Validate email format"""
     if not email:
         return False
     
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return EMAIL_RE.match(email) is not None
 
 
 def validate_password(password: str) -> bool:
@@ -22,10 +38,7 @@ def validate_password(password: str) -> bool:
         return False
     
     # Must contain at least one letter and one number
-    has_letter = re.search(r'[a-zA-Z]', password)
-    has_number = re.search(r'\d', password)
-    
-    return has_letter and has_number
+    return LETTER_RE.search(password) is not None and DIGIT_RE.search(password) is not None
 
 
 def validate_student_data(data: Dict[str, Any]) -> List[str]:
@@ -33,8 +46,7 @@ def validate_student_data(data: Dict[str, Any]) -> List[str]:
     errors = []
     
     # Required fields
-    required_fields = ['first_name', 'last_name', 'student_id', 'grade', 'date_of_birth']
-    for field in required_fields:
+    for field in STUDENT_REQUIRED_FIELDS:
         if not data.get(field):
             errors.append(f'{field} is required')
     
@@ -49,12 +61,35 @@ def validate_student_data(data: Dict[str, Any]) -> List[str]:
     
     # Student ID validation
     student_id = data.get('student_id')
-    if student_id and not re.match(r'^[A-Z0-9]{6,10}$', student_id.upper()):
+    if student_id and not STUDENT_ID_RE.match(student_id.upper()):
         errors.append('Student ID must be 6-10 alphanumeric characters')
     
     return errors
 
 
+def validate_student_rows(rows: List[Any]) -> Dict[int, List[str]]:
+    """Validate a batch of student records (e.g. a bulk import)
+    
+    Returns the errors of each invalid row keyed by its index; rows that are
+    not objects, or whose fields have the wrong type, are reported instead
+    of raising.
+    """
+    invalid = {}
+    
+    for index, data in enumerate(rows):
+        if not isinstance(data, dict):
+            invalid[index] = ['Row must be an object']
+            continue
+        try:
+            errors = validate_student_data(data)
+        except (AttributeError, TypeError) as e:
+            errors = [str(e)]
+        if errors:
+            invalid[index] = errors
+    
+    return invalid
+
+
 def validate_class_data(data: Dict[str, Any]) -> List[str]:
     """Validate class data"""
     errors = []
@@ -67,7 +102,7 @@ def validate_class_data(data: Dict[str, Any]) -> List[str]:
     
     # Class code validation
     class_code = data.get('class_code')
-    if class_code and not re.match(r'^[A-Z]{2,4}\d{3,4}$', class_code.upper()):
+    if class_code and not CLASS_CODE_RE.match(class_code.upper()):
         errors.append('Class code must be 2-4 letters followed by 3-4 numbers (e.g., MATH101)')
     
     return errors
@@ -85,9 +120,8 @@ def validate_attendance_data(data: Dict[str, Any]) -> List[str]:
     
     # Status validation
     status = data.get('status')
-    valid_statuses = ['present', 'absent', 'late', 'excused']
-    if status and status.lower() not in valid_statuses:
-        errors.append(f'Status must be one of: {", ".join(valid_statuses)}')
+    if status and status.lower() not in VALID_STATUSES:
+        errors.append(f'Status must be one of: {", ".join(VALID_STATUSES)}')
     
     # Date validation
     date_str = data.get('date')
@@ -104,8 +138,7 @@ def sanitize_input(data: Any) -> Any:
     """Sanitize input data to prevent injection attacks"""
     if isinstance(data, str):
         # Remove potentially dangerous characters
-        data = re.sub(r'[<>"\';]', '', data)
-        return data.strip()
+        return data.translate(SANITIZE_TABLE).strip()
     elif isinstance(data, dict):
         return {key: sanitize_input(value) for key, value in data.items()}
     elif isinstance(data, list):
@@ -147,8 +180,7 @@ def validate_id_format(id_value: str, field_name: str = "ID") -> List[str]:
         return errors
     
     # Check for valid ObjectId format (24 hex characters) or UUID format
-    if not (re.match(r'^[a-f0-9]{24}$', id_value, re.IGNORECASE) or 
-            re.match(r'^[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}$', id_value, re.IGNORECASE)):
+    if not (OBJECT_ID_RE.match(id_value) or UUID_RE.match(id_value)):
         errors.append(f"{field_name} must be a valid ObjectId or UUID format")
     
     return errors
@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration for the attendance API
+Usage: gunicorn -c gunicorn.conf.py main:app
+"""
+
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# Handlers spend most of their time waiting on MongoDB/Redis, so each worker
+# runs a thread pool: pymongo releases the GIL on socket I/O and one process
+# keeps many queries in flight without an async framework port
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+
+# The app (and its MongoClient) is created in each worker after fork
+preload_app = False
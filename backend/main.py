@@ -4,7 +4,9 @@ Alexander Academy - Private High School, Vancouver
 """
 
 import os
+import logging
 from datetime import timedelta
+from types import SimpleNamespace
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
@@ -16,6 +18,10 @@ load_dotenv()
 # Import routes
 from app.routes import register_routes
 from app.database import MongoDB
+from app.models import User, Class, Student, Attendance
+from app.routes.auth import is_token_revoked
+from app.utils.redis_store import create_redis_client
+from app.utils.json_provider import OrjsonProvider, ORJSON_AVAILABLE
 from app.utils.api_response import (
     success_response, error_response
 )
@@ -24,12 +30,21 @@ def create_app():
     """Application factory pattern"""
     app = Flask(__name__)
     
+    # Serialize requests/responses with orjson when available
+    if ORJSON_AVAILABLE:
+        app.json = OrjsonProvider(app)
+    
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-string')
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-string')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
     
+    # Application logging: verbose in development, warnings and errors otherwise
+    is_development = os.getenv('ENVIRONMENT', 'development') == 'development'
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger('app').setLevel(logging.DEBUG if is_development else logging.WARNING)
+    
     # Disable strict slashes to prevent 308 redirects
     app.url_map.strict_slashes = False
 
@@ -59,9 +74,21 @@ def create_app():
     app.db = mongodb.db
     app.mongodb = mongodb
     
+    # Model wrappers are stateless proxies over their collections - build them once
+    if app.db is not None:
+        app.extensions['models'] = SimpleNamespace(
+            user=User(app.db),
+            cls=Class(app.db),
+            student=Student(app.db),
+            attendance=Attendance(app.db)
+        )
+    
     # Check and seed data if database is empty
     mongodb.check_and_seed_data()
     
+    # Shared Redis store (token revocation, caches)
+    app.redis = create_redis_client()
+    
     # JWT error handlers
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -75,6 +102,14 @@ def create_app():
     def missing_token_callback(error):
         return error_response('Authorization token is required', 401)
     
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return is_token_revoked(jwt_payload)
+    
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        return error_response('Token has been revoked', 401)
+    
     # Register all route blueprints
     register_routes(app)
     